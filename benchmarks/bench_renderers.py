@@ -0,0 +1,139 @@
+"""Compare the page renderers behind the preview.
+
+Usage::
+
+    python benchmarks/bench_renderers.py [--pages 50] [--columns 2] \\
+        [--height 600] [--threads 1 4] [--renderers pdf2image pdfium] \\
+        [--output results.json]
+
+For every renderer that is installed, a synthetic PDF is opened and rendered
+page by page without any caching, as when paging through a new document:
+
+* ``open``: creating the ``Document`` (page count and size)
+* ``preview``: one page at ``--height`` pixels, in page order
+* ``full``: one page at 200 dpi
+* ``throughput``: all pages at ``--height`` from ``--threads`` threads at once,
+  as the prefetcher does, in pages per second
+
+pdf2image and pdftocairo need poppler on the PATH; pdfium and mupdf need the
+``pypdfium2`` and ``pymupdf`` packages. Renderers that are not available are
+skipped rather than silently replaced by pdf2image.
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from synthetic_pdf import write_pdf
+
+from journal2ebook._document import Document
+from journal2ebook._render import RENDERERS
+
+
+def available(renderer: str, path: Path) -> bool:
+    try:
+        document = Document(path, renderer=renderer)
+    except Exception as e:  # noqa: BLE001
+        print(f"{renderer}: not available ({e})")
+        return False
+    document.close()
+    if document.renderer != renderer:
+        print(f"{renderer}: not installed")
+        return False
+    return True
+
+
+def per_call(func: Any, args: list[Any]) -> list[float]:
+    runs = []
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def summary(runs: list[float]) -> dict[str, float]:
+    ordered = sorted(runs)
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(
+            ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)] * 1000, 3
+        ),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def bench(renderer: str, path: Path, args: argparse.Namespace) -> dict[str, Any]:
+    result: dict[str, Any] = {"renderer": renderer}
+    result["open"] = summary(
+        per_call(lambda _: Document(path, renderer=renderer).close(), [None] * 5)
+    )
+
+    document = Document(path, renderer=renderer)
+    pages = list(range(1, document.num_pages + 1))
+    result["preview"] = summary(
+        per_call(lambda n: document.render(n, size=(None, args.height)), pages)
+    )
+    result["full"] = summary(
+        per_call(lambda n: document.render(n, dpi=200), pages[: args.full_pages])
+    )
+
+    for threads in args.threads:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(
+                executor.map(
+                    lambda n: document.render(n, size=(None, args.height)), pages
+                )
+            )
+        seconds = time.perf_counter() - start
+        result[f"throughput_{threads}_threads"] = round(len(pages) / seconds, 2)
+    document.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--full-pages", type=int, default=10)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument(
+        "--renderers", nargs="+", choices=RENDERERS, default=list(RENDERERS)
+    )
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "bench.pdf"
+        write_pdf(path, args.pages, columns=args.columns)
+        for renderer in args.renderers:
+            if available(renderer, path):
+                results.append(bench(renderer, path, args))
+
+    header = f"{'renderer':12} {'open':>9} {'preview':>9} {'p95':>9} {'full':>9}"
+    throughput = [f"{t} thr" for t in args.threads]
+    print(header + "".join(f" {t:>9}" for t in throughput))
+    for r in results:
+        line = (
+            f"{r['renderer']:12} {r['open']['median_ms']:7.1f}ms "
+            f"{r['preview']['median_ms']:7.1f}ms {r['preview']['p95_ms']:7.1f}ms "
+            f"{r['full']['median_ms']:7.1f}ms"
+        )
+        for t in args.threads:
+            line += f" {r[f'throughput_{t}_threads']:6.1f}p/s"
+        print(line)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=4), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
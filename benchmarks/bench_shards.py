@@ -0,0 +1,75 @@
+"""Compare single-process and sharded k2pdfopt conversion of one PDF.
+
+Usage::
+
+    python benchmarks/bench_shards.py paper.pdf --shard-size 25 --workers 2 4 8
+
+Needs k2pdfopt and poppler (pdfinfo, pdfunite) on the PATH.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pdf2image
+
+from journal2ebook._config import Profile
+from journal2ebook._convert import conversion_job
+
+
+def run(path: Path, num_pages: int, *, executable, shard_size: int, workers: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        job = conversion_job(
+            path,
+            Profile("benchmark"),
+            num_pages,
+            executable=executable,
+            output=Path(tmpdir) / "output.pdf",
+            shard_size=shard_size,
+            workers=workers,
+        )
+        start = time.perf_counter()
+        job.start()
+        job.wait()
+        seconds = time.perf_counter() - start
+
+    if not job.ok:
+        msg = f"k2pdfopt failed with exit status {job.returncode}:\n{job.stderr}"
+        raise SystemExit(msg)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--k2pdfopt", default=None)
+    parser.add_argument("--shard-size", type=int, default=25)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    num_pages = int(pdf2image.pdfinfo_from_path(args.pdf)["Pages"])
+    print(f"{args.pdf}: {num_pages} pages, shard size {args.shard_size}")
+
+    def best(shard_size, workers):
+        return min(
+            run(
+                args.pdf,
+                num_pages,
+                executable=args.k2pdfopt,
+                shard_size=shard_size,
+                workers=workers,
+            )
+            for _ in range(args.repeat)
+        )
+
+    baseline = best(0, 1)
+    print(f"{'single process':>16}: {baseline:8.2f} s")
+    for workers in args.workers:
+        seconds = best(args.shard_size, workers)
+        print(f"{workers:>8} workers: {seconds:8.2f} s  ({baseline / seconds:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measure import time and time-to-window of the GUI.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--pdf paper.pdf] [--max-import-ms 150]
+
+The import time is taken from ``python -X importtime``. With ``--pdf`` (and a
+display), the GUI is started and the time until the window is mapped and until
+the first page is drawn are reported as well. The script exits with status 1 if a
+limit is exceeded, so it can guard against startup regressions.
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+MODULE = "journal2ebook._window"
+
+GUI_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import tkinter as tk
+from pathlib import Path
+from journal2ebook._window import App
+
+timings = {}
+root = tk.Tk()
+app = App(root, Path(sys.argv[1]))
+
+def on_map(event):
+    if event.widget is root and "window" not in timings:
+        timings["window"] = time.perf_counter() - start
+
+def poll():
+    if getattr(app, "img", None) is not None:
+        timings["first_page"] = time.perf_counter() - start
+        root.destroy()
+    else:
+        root.after(5, poll)
+
+root.bind("<Map>", on_map)
+root.after(5, poll)
+root.mainloop()
+print(json.dumps(timings))
+"""
+
+
+def import_time_ms() -> float:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$", line)
+        if match and match.group(2) == MODULE:
+            return int(match.group(1)) / 1000
+    msg = f"{MODULE} not found in -X importtime output"
+    raise RuntimeError(msg)
+
+
+def gui_times_ms(pdf: str) -> dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", GUI_SCRIPT, pdf],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(result.stdout.splitlines()[-1])
+    return {name: seconds * 1000 for name, seconds in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pdf")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-window-ms", type=float)
+    args = parser.parse_args()
+
+    failed = False
+
+    imports = statistics.median(import_time_ms() for _ in range(args.repeat))
+    print(f"import {MODULE}: {imports:8.1f} ms")
+    if args.max_import_ms is not None and imports > args.max_import_ms:
+        print(f"  exceeds limit of {args.max_import_ms} ms")
+        failed = True
+
+    if args.pdf:
+        runs = [gui_times_ms(args.pdf) for _ in range(args.repeat)]
+        for name in ("window", "first_page"):
+            value = statistics.median(run[name] for run in runs)
+            print(f"{name:>24}: {value:8.1f} ms")
+        window = statistics.median(run["window"] for run in runs)
+        if args.max_window_ms is not None and window > args.max_window_ms:
+            print(f"  window exceeds limit of {args.max_window_ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Measure how preview rendering and conversion scale with the document.
+
+Usage::
+
+    python benchmarks/bench_suite.py --pages 10 100 1000 --columns 1 2 4 \\
+        --output results.json [--baseline previous.json]
+
+Synthetic PDFs are generated in a temporary directory for every combination of
+page count, column count and page size. For each one the stages below are
+timed and written to a JSON file that can be compared between releases with
+``--baseline``:
+
+* ``pdfinfo``: opening the document (``Document``)
+* ``rasterize``: rendering a page at full resolution
+* ``preview``: rendering a page at display height
+* ``photo_image``: turning a preview into a Tk image
+* ``draw_image``: ``App.draw_image`` for a cached page
+* ``scale_draw``: ``Scale.draw`` for all four sliders
+* ``convert``: a conversion job running ``stub_k2pdfopt.py``, so that only
+  journal2ebook's own orchestration is measured
+* ``convert_sharded``: the same, split into shards (needs ``pdfunite``)
+
+Without a display (e.g. outside ``xvfb-run``), Tk is mocked out: the GUI stages
+then measure only journal2ebook's code and ``photo_image`` is skipped.
+
+Needs poppler (pdfinfo, pdftoppm) on the PATH.
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tkinter as tk
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+from synthetic_pdf import PAGE_SIZES, write_pdf
+
+from journal2ebook import __version__, _window
+from journal2ebook._cache import LRUCache
+from journal2ebook._config import Profile
+from journal2ebook._convert import MERGE_EXECUTABLE, conversion_job
+from journal2ebook._document import Document
+from journal2ebook._window import App, Position, Scale
+
+STUB_K2PDFOPT = Path(__file__).with_name("stub_k2pdfopt.py")
+PREVIEW_HEIGHT = 600
+SHARD_SIZE = 25
+SHARD_WORKERS = 4
+
+
+def measure(func: Callable[[], Any], *, repeat: int, number: int = 1) -> list[float]:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+    return runs
+
+
+class FakeCanvas:
+    def coords(self, *args):
+        pass
+
+    def itemconfigure(self, *args, **kwargs):
+        pass
+
+
+class GUI:
+    # Just enough of App for draw_image and the sliders, on a real Tk root if
+    # there is a display and on stand-ins otherwise.
+    def __init__(self):
+        try:
+            self.root: Optional[tk.Tk] = tk.Tk()
+            self.root.withdraw()
+        except tk.TclError:
+            self.root = None
+
+    @property
+    def mocked(self) -> bool:
+        return self.root is None
+
+    def app(self, document: Document, img: Any) -> Any:
+        height = PREVIEW_HEIGHT
+        width = int(height * document.aspect)
+        if self.mocked:
+            app: Any = SimpleNamespace(canvas=FakeCanvas())
+            app.page = SimpleNamespace(get=lambda: 1)
+            app._image_item = app._placeholder_item = 1
+        else:
+            app = tk.Frame(self.root)
+            app.canvas = tk.Canvas(app, width=width, height=height)
+            app.page = tk.IntVar(app, value=1)
+            app._image_item = app.canvas.create_image(width / 2, height / 2)
+            app._placeholder_item = app.canvas.create_text(width / 2, height / 2)
+
+        app.width, app.height = width, height
+        app._document = document
+        app._photos = LRUCache()
+        app._photos[1] = self.photo(img)
+        app.prefetch = lambda number: None
+        app.invalidate = lambda *parts: None
+        app.zoom, app.view_x, app.view_y = 1.0, 0, 0
+        app.clear_tiles = lambda: None
+        return app
+
+    def scales(self, app: Any) -> list[Any]:
+        if not self.mocked:
+            return [Scale(app, position=position) for position in Position]
+        return [
+            SimpleNamespace(
+                master=app,
+                canvas=app.canvas,
+                horizontal=position in (Position.LEFT, Position.RIGHT),
+                get=lambda: 0.25,
+                _item_id=1,
+            )
+            for position in Position
+        ]
+
+    def photo(self, img: Any) -> Any:
+        return img if self.mocked else _window.photo_image(img)
+
+    def destroy(self, app: Any):
+        if not self.mocked:
+            app.destroy()
+
+
+def bench_document(
+    path: Path, gui: GUI, *, repeat: int, convert: bool
+) -> dict[str, list[float]]:
+    timings = {}
+    timings["pdfinfo"] = measure(lambda: Document(path), repeat=repeat)
+
+    document = Document(path)
+    middle = (document.num_pages + 1) // 2
+    timings["rasterize"] = measure(lambda: document.render(middle), repeat=repeat)
+
+    def preview():
+        document.trim()
+        return document.preview(middle, PREVIEW_HEIGHT)
+
+    timings["preview"] = measure(preview, repeat=repeat)
+
+    img = preview()
+    if not gui.mocked:
+        timings["photo_image"] = measure(lambda: gui.photo(img), repeat=repeat)
+
+    app = gui.app(document, img)
+    timings["draw_image"] = measure(
+        lambda: App.draw_image(app), repeat=repeat, number=100
+    )
+    scales = gui.scales(app)
+    timings["scale_draw"] = measure(
+        lambda: [Scale.draw(scale) for scale in scales], repeat=repeat, number=100
+    )
+    gui.destroy(app)
+
+    if convert:
+        timings["convert"] = measure(
+            lambda: run_conversion(path, document.num_pages, shard_size=0),
+            repeat=repeat,
+        )
+        if shutil.which(MERGE_EXECUTABLE) and document.num_pages > SHARD_SIZE:
+            timings["convert_sharded"] = measure(
+                lambda: run_conversion(path, document.num_pages, shard_size=SHARD_SIZE),
+                repeat=repeat,
+            )
+    return timings
+
+
+def run_conversion(path: Path, num_pages: int, *, shard_size: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        job = conversion_job(
+            path,
+            Profile("benchmark"),
+            num_pages,
+            executable=str(STUB_K2PDFOPT),
+            output=Path(tmpdir) / "output.pdf",
+            shard_size=shard_size,
+            workers=SHARD_WORKERS,
+        )
+        job.start()
+        job.wait()
+    if not job.ok:
+        msg = f"Stub conversion failed with exit status {job.returncode}:\n{job.stderr}"
+        raise SystemExit(msg)
+
+
+def compare(results: list[dict], baseline_path: Path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (r["pages"], r["columns"], r["page_size"], r["stage"]): r["median"]
+            for r in json.load(f)["results"]
+        }
+
+    print(f"\nCompared with {baseline_path} (ratio > 1 is slower):")
+    for r in results:
+        old = baseline.get((r["pages"], r["columns"], r["page_size"], r["stage"]))
+        if old:
+            label = f"{r['pages']:>5}p {r['columns']}col {r['page_size']:<6}"
+            print(f"{label} {r['stage']:>16}: {r['median'] / old:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--page-sizes", nargs="+", choices=sorted(PAGE_SIZES), default=["letter"]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-convert", action="store_true")
+    parser.add_argument("--output", type=Path, default=Path("bench-results.json"))
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args()
+
+    gui = GUI()
+    if gui.mocked:
+        print("No display available; Tk is mocked out and photo_image is skipped")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for page_size in args.page_sizes:
+            for columns in args.columns:
+                for pages in args.pages:
+                    path = Path(tmpdir) / f"{pages}-{columns}-{page_size}.pdf"
+                    write_pdf(path, pages, columns=columns, page_size=page_size)
+                    timings = bench_document(
+                        path, gui, repeat=args.repeat, convert=not args.no_convert
+                    )
+                    for stage, runs in timings.items():
+                        median = statistics.median(runs)
+                        results.append(
+                            {
+                                "pages": pages,
+                                "columns": columns,
+                                "page_size": page_size,
+                                "stage": stage,
+                                "median": median,
+                                "min": min(runs),
+                                "runs": runs,
+                            }
+                        )
+                        label = f"{pages:>5}p {columns}col {page_size:<6}"
+                        print(f"{label} {stage:>16}: {median * 1000:10.3f} ms")
+
+    report = {
+        "version": __version__,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "tk_mocked": gui.mocked,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
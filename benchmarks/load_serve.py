@@ -0,0 +1,191 @@
+"""Load-test ``journal2ebook serve`` on one machine.
+
+Usage::
+
+    python benchmarks/load_serve.py --clients 8 --requests 200 --workers 4 \\
+        [--pages 10] [--delay 0.01] [--output results.json]
+
+Starts the conversion service in-process on a loopback port, with
+``stub_k2pdfopt.py`` in place of k2pdfopt, and has ``--clients`` threads each
+upload a synthetic PDF, wait for the job and download the result until
+``--requests`` jobs are done. Reports throughput, end-to-end and per-request
+latencies, and the server's own ``/metrics``. Pass ``--url`` to load an already
+running server instead (which then uses whatever k2pdfopt it is configured
+with).
+
+Needs poppler (pdfinfo) on the PATH, as the service reads the page count.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from synthetic_pdf import write_pdf
+
+from journal2ebook._config import Profile
+from journal2ebook._serve import ConversionService, Server, summarize
+
+STUB_K2PDFOPT = Path(__file__).with_name("stub_k2pdfopt.py")
+
+
+def request(
+    conn: http.client.HTTPConnection,
+    method: str,
+    path: str,
+    body: Optional[bytes] = None,
+) -> tuple[int, bytes]:
+    headers = {"Content-Type": "application/pdf"} if body is not None else {}
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def client(
+    host: str,
+    port: int,
+    pdf: bytes,
+    profile: str,
+    remaining: list[int],
+    lock: threading.Lock,
+    results: list[dict[str, Any]],
+):
+    conn = http.client.HTTPConnection(host, port, timeout=600)
+    while True:
+        with lock:
+            if remaining[0] <= 0:
+                break
+            remaining[0] -= 1
+
+        start = time.perf_counter()
+        status, body = request(
+            conn, "POST", f"/jobs?profile={profile}&filename=load.pdf", pdf
+        )
+        submitted = time.perf_counter()
+        if status != 202:
+            results.append({"ok": False, "status": status, "submit": submitted - start})
+            # Refused uploads close the connection
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=600)
+            time.sleep(0.1)
+            continue
+
+        job_id = json.loads(body)["id"]
+        status, body = request(conn, "GET", f"/jobs/{job_id}/result?wait=300")
+        finished = time.perf_counter()
+        results.append(
+            {
+                "ok": status == 200 and len(body) > 0,
+                "status": status,
+                "submit": submitted - start,
+                "result": finished - submitted,
+                "total": finished - start,
+            }
+        )
+        request(conn, "DELETE", f"/jobs/{job_id}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Stub k2pdfopt seconds per page"
+    )
+    parser.add_argument("--profile", default="Default")
+    parser.add_argument("--url", help="Load this server instead of starting one")
+    parser.add_argument("--output", type=Path, help="Write results as JSON")
+    args = parser.parse_args()
+
+    tmpdir = Path(tempfile.mkdtemp(prefix="journal2ebook-load-"))
+    server = None
+    try:
+        pdf_path = tmpdir / "load.pdf"
+        write_pdf(pdf_path, args.pages, columns=2)
+        pdf = pdf_path.read_bytes()
+
+        if args.url is None:
+            os.environ["STUB_K2PDFOPT_DELAY"] = str(args.delay)
+            service = ConversionService(
+                tmpdir / "spool",
+                lambda name: Profile(name=name),
+                workers=args.workers,
+                max_queue=args.max_queue,
+                executable=str(STUB_K2PDFOPT),
+            )
+            server = Server(("127.0.0.1", 0), service)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            host, port = server.server_address[:2]
+        else:
+            url = urlsplit(args.url)
+            host, port = url.hostname or "127.0.0.1", url.port or 80
+
+        results: list[dict[str, Any]] = []
+        remaining = [args.requests]
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(host, port, pdf, args.profile, remaining, lock, results),
+            )
+            for _ in range(args.clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        _, body = request(conn, "GET", "/metrics")
+        conn.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            server.service.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    done = [r for r in results if r["ok"]]
+    report = {
+        "clients": args.clients,
+        "requests": args.requests,
+        "workers": args.workers,
+        "pages": args.pages,
+        "delay": args.delay,
+        "wall_seconds": round(wall, 3),
+        "succeeded": len(done),
+        "failed": len(results) - len(done),
+        "jobs_per_second": round(len(done) / wall, 3),
+        "submit_seconds": summarize(r["submit"] for r in results),
+        "result_seconds": summarize(r["result"] for r in done),
+        "total_seconds": summarize(r["total"] for r in done),
+        "server": json.loads(body),
+    }
+
+    print(
+        f"{report['succeeded']}/{args.requests} jobs in {wall:.2f}s "
+        f"({report['jobs_per_second']} jobs/s), "
+        f"p50 {report['total_seconds'].get('p50', '-')}s "
+        f"p95 {report['total_seconds'].get('p95', '-')}s end to end"
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=4), encoding="utf-8")
+    else:
+        print(json.dumps(report["server"], indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Stand-in for k2pdfopt that only measures journal2ebook's own overhead.
+
+It accepts the arguments journal2ebook passes, prints the same ``SOURCE PAGE``
+progress lines k2pdfopt does and copies the input to the ``-o`` output. Set
+``STUB_K2PDFOPT_DELAY`` to a number of seconds to spend per page.
+"""
+
+import os
+import shutil
+import sys
+import time
+
+
+def main(argv: list[str]) -> int:
+    pages, output = None, None
+    args = iter(argv)
+    positional = []
+    for arg in args:
+        if arg == "-p":
+            pages = next(args)
+        elif arg == "-o":
+            output = next(args)
+        elif arg in ("-col", "-ml", "-mr", "-mt", "-mb"):
+            next(args)
+        elif not arg.startswith("-"):
+            positional.append(arg)
+    if not positional or output is None:
+        print("usage: stub_k2pdfopt.py [options] -o OUTPUT INPUT", file=sys.stderr)
+        return 2
+
+    first, _, last = (pages or "1-1").partition("-")
+    delay = float(os.environ.get("STUB_K2PDFOPT_DELAY", "0"))
+    for number in range(int(first), int(last or first) + 1):
+        if delay:
+            time.sleep(delay)
+        print(f"SOURCE PAGE {number} (of {last or first})", flush=True)
+
+    shutil.copyfile(positional[-1], output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,147 @@
+"""Write synthetic journal-like PDFs for the benchmarks.
+
+Usage::
+
+    python benchmarks/synthetic_pdf.py out.pdf --pages 100 --columns 2
+
+Each page has a running header, a page number and body text set in 1, 2 or 4
+columns, with a figure-sized box every few pages. Only the standard library is
+used, so the benchmarks do not depend on a PDF writer being installed.
+"""
+
+import argparse
+import zlib
+from pathlib import Path
+
+PAGE_SIZES = {
+    "letter": (612, 792),
+    "a4": (595, 842),
+    "a3": (842, 1191),
+}
+
+MARGIN = 54
+GUTTER = 18
+FONT_SIZE = 9
+LEADING = 11
+FIGURE_EVERY = 5
+
+TEXT = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua ut enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo "
+    "consequat duis aute irure dolor in reprehenderit in voluptate velit esse"
+)
+WORDS = TEXT.split()
+
+
+def _lines(width: float, count: int, seed: int) -> list[str]:
+    # Helvetica averages about half an em per character
+    max_chars = int(width / (0.5 * FONT_SIZE))
+    lines, line, i = [], "", seed
+    while len(lines) < count:
+        word = WORDS[i % len(WORDS)]
+        i += 7
+        if len(line) + len(word) + 1 > max_chars:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines
+
+
+def _page_content(number: int, columns: int, size: tuple[int, int]) -> bytes:
+    width, height = size
+    column_width = (width - 2 * MARGIN - (columns - 1) * GUTTER) / columns
+    top = height - MARGIN - 2 * LEADING
+    ops = [
+        "BT",
+        f"/F1 {FONT_SIZE} Tf",
+        f"1 0 0 1 {MARGIN} {height - MARGIN} Tm",
+        "(Journal of Synthetic Benchmarks) Tj",
+        f"1 0 0 1 {width / 2 - 5} {MARGIN / 2} Tm",
+        f"({number}) Tj",
+        "ET",
+    ]
+
+    body_lines = int((top - MARGIN) / LEADING)
+    figure = number % FIGURE_EVERY == 0
+    for column in range(columns):
+        x = MARGIN + column * (column_width + GUTTER)
+        lines = body_lines
+        if figure and column == 0:
+            # Leave the upper third of the first column for a figure
+            lines = body_lines * 2 // 3
+            box = body_lines // 3 * LEADING
+            ops.append(f"0.6 g {x} {top - box} {column_width} {box} re f 0 g")
+        ops.append("BT")
+        ops.append(f"/F1 {FONT_SIZE} Tf {LEADING} TL")
+        ops.append(f"1 0 0 1 {x} {MARGIN + lines * LEADING} Tm")
+        for line in _lines(column_width, lines, seed=number * 31 + column):
+            ops.append(f"({line}) '")
+        ops.append("ET")
+    return "\n".join(ops).encode("ascii")
+
+
+def write_pdf(
+    path: Path, pages: int, *, columns: int = 1, page_size: str = "letter"
+) -> Path:
+    size = PAGE_SIZES[page_size]
+
+    # Objects 1-3 are the catalog, the page tree and the font; every page then
+    # takes two objects, the page and its content stream.
+    objects: list[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for number in range(1, pages + 1):
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {size[0]} {size[1]}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_id + 1} 0 R >>".encode("ascii")
+        )
+        stream = zlib.compress(_page_content(number, columns, size))
+        objects.append(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+            + stream
+            + b"\nendstream"
+        )
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode("ascii")
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+
+    path.write_bytes(out)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--columns", type=int, choices=(1, 2, 4), default=1)
+    parser.add_argument("--page-size", choices=sorted(PAGE_SIZES), default="letter")
+    args = parser.parse_args()
+
+    write_pdf(args.output, args.pages, columns=args.columns, page_size=args.page_size)
+    print(f"{args.output}: {args.pages} pages, {args.output.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+import pdf2image
+
+from ._config import Profile
+from ._convert import BaseJob, conversion_job, output_path
+from ._diskcache import file_digest
+from ._results import ResultCache
+from ._store import Store
+
+
+@dataclass
+class BatchResult:
+    path: Path
+    status: str
+    seconds: float
+    returncode: Optional[int] = None
+    output: Optional[Path] = None
+    output_bytes: Optional[int] = None
+    message: str = ""
+    profile: Optional[str] = None
+    pages: Optional[int] = None
+    file_hash: Optional[str] = None
+
+    def to_json(self) -> dict:
+        ret = asdict(self)
+        ret["path"] = str(self.path)
+        ret["output"] = None if self.output is None else str(self.output)
+        return ret
+
+
+# Either a fixed profile or a function choosing one for each file
+ProfileChoice = Union[Profile, Callable[[Path], Profile]]
+
+
+def convert_file(
+    path: Path,
+    profile: ProfileChoice,
+    *,
+    executable: Optional[str] = None,
+    output_dir: Optional[Path] = None,
+    shard_size: int = 0,
+    shard_workers: int = 1,
+    result_cache: Optional[ResultCache] = None,
+) -> BatchResult:
+    start = time.monotonic()
+
+    output = output_path(path)
+    if output_dir is not None:
+        output = output_dir / output.name
+
+    try:
+        if callable(profile):
+            profile = profile(path)
+        num_pages = int(pdf2image.pdfinfo_from_path(path)["Pages"])
+        digest = file_digest(path)
+        job = conversion_job(
+            path,
+            profile,
+            num_pages,
+            executable=executable,
+            output=output,
+            shard_size=shard_size,
+            workers=shard_workers,
+            result_cache=result_cache,
+            digest=digest,
+        )
+        job.start()
+        job.wait()
+    except Exception as e:  # noqa: BLE001
+        return BatchResult(path, "error", time.monotonic() - start, message=str(e))
+
+    seconds = time.monotonic() - start
+    if not job.ok:
+        return BatchResult(
+            path,
+            "failed",
+            seconds,
+            returncode=job.returncode,
+            message=job.stderr.strip(),
+            profile=profile.name,
+            pages=num_pages,
+            file_hash=digest,
+        )
+
+    return BatchResult(
+        path,
+        "ok",
+        seconds,
+        returncode=job.returncode,
+        output=output,
+        output_bytes=output.stat().st_size if output.exists() else None,
+        profile=profile.name,
+        pages=num_pages,
+        file_hash=digest,
+    )
+
+
+def run_batch(
+    paths: Iterable[Path],
+    profile: ProfileChoice,
+    *,
+    jobs: int = 1,
+    executable: Optional[str] = None,
+    output_dir: Optional[Path] = None,
+    shard_size: int = 0,
+    shard_workers: int = 1,
+    result_cache: Optional[ResultCache] = None,
+    on_result: Optional[Callable[[BatchResult], None]] = None,
+) -> list[BatchResult]:
+    # Every job is its own k2pdfopt process, so the worker threads only wait on
+    # subprocesses and `jobs` bounds how many of them run at once.
+    results = []
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [
+            executor.submit(
+                convert_file,
+                path,
+                profile,
+                executable=executable,
+                output_dir=output_dir,
+                shard_size=shard_size,
+                shard_workers=shard_workers,
+                result_cache=result_cache,
+            )
+            for path in paths
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def write_summary(results: list[BatchResult], path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([r.to_json() for r in results], f, indent=4)
+
+
+def record_history(store: Store, result: BatchResult):
+    store.add_history(
+        path=str(result.path),
+        file_hash=result.file_hash,
+        profile=result.profile,
+        status=result.status,
+        returncode=result.returncode,
+        seconds=result.seconds,
+        pages=result.pages,
+        output=None if result.output is None else str(result.output),
+        output_bytes=result.output_bytes,
+    )
+
+
+def record_job(
+    store: Store,
+    job: BaseJob,
+    *,
+    path: Path,
+    profile: Profile,
+    pages: int,
+    file_hash: Optional[str],
+    output: Path,
+):
+    # For jobs run outside run_batch; called on the job's thread
+    store.add_history(
+        path=str(path),
+        file_hash=file_hash,
+        profile=profile.name,
+        status=job.status,
+        returncode=job.returncode,
+        seconds=job.elapsed,
+        pages=pages,
+        output=str(output) if job.ok else None,
+        output_bytes=output.stat().st_size if job.ok and output.exists() else None,
+    )
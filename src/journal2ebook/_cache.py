@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def image_nbytes(img: Any) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+def photo_nbytes(photo: Any) -> int:
+    # Tk keeps photo images as 32-bit RGBA, whatever the source mode
+    return photo.width() * photo.height() * 4
+
+
+class LRUCache:
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda _: 1,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._nbytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, size = self._data.pop(key)
+            self._nbytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+
+    def _evict(self):
+        # Always keep the most recently inserted entry, even if it alone exceeds
+        # the byte budget, so that the current page can be displayed.
+        while len(self._data) > 1 and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self._nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self._nbytes -= size
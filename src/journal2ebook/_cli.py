@@ -0,0 +1,450 @@
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from ._config import CACHE_DIR, Config
+from ._exceptions import ProfileNotFoundError
+from ._memory import peak_rss_bytes
+
+# --profile value for batch and watch that picks a profile for each file
+AUTO_PROFILE = "auto"
+
+
+def profile_choice(config: Config, name: str):
+    profiles = config["profiles"]
+    if name == AUTO_PROFILE and all(p.name != name for p in profiles):
+        from ._fingerprint import profile_selector
+
+        return profile_selector(profiles)
+    return config.find_profile(name)
+
+
+def resolve_profile(config: Config, name: str):
+    try:
+        return profile_choice(config, name)
+    except ProfileNotFoundError as e:
+        raise click.BadParameter(str(e), param_hint="--profile")
+
+
+class DefaultGroup(click.Group):
+    # `journal2ebook [PATH]` keeps opening the GUI; anything that is not the name
+    # of a subcommand is passed on to the `gui` command.
+    def resolve_command(self, ctx: click.Context, args: list[str]):
+        if args and self.get_command(ctx, args[0]) is None:
+            return "gui", self.commands["gui"], args
+        return super().resolve_command(ctx, args)
+
+
+@click.group(cls=DefaultGroup, invoke_without_command=True)
+@click.option("-v", "--verbose", count=True, help="Log more; repeat for debug output.")
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write timed spans to this file (Chrome trace, or JSON lines for .jsonl).",
+)
+@click.option(
+    "--cprofile",
+    "profile_session",
+    is_flag=True,
+    help="Run under cProfile and tracemalloc and print the results on exit.",
+)
+@click.pass_context
+def main(
+    ctx: click.Context, verbose: int, trace: Optional[Path], profile_session: bool
+):
+    """Convert academic PDFs for e-readers with k2pdfopt."""
+    from . import _trace
+
+    logging.basicConfig(
+        level=max(logging.WARNING - 10 * verbose, logging.DEBUG),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    if trace is not None:
+        _trace.start_trace(trace)
+        ctx.call_on_close(_trace.stop_trace)
+    if profile_session:
+        ctx.with_resource(_trace.profiled())
+    ctx.call_on_close(_trace.log_stages)
+
+    if ctx.invoked_subcommand is None:
+        ctx.invoke(gui)
+
+
+@main.command()
+@click.argument("path", type=click.Path(exists=True, path_type=Path), required=False)
+def gui(path: Optional[Path] = None):
+    """Open PATH in the margin editor."""
+    from ._window import run
+
+    run(path)
+
+
+@main.command()
+@click.option(
+    "--profile",
+    "profile_name",
+    default="Default",
+    show_default=True,
+    help=f"Saved profile to use, or {AUTO_PROFILE!r} to pick one by page layout.",
+)
+@click.option("-j", "--jobs", default=1, show_default=True, type=click.IntRange(1))
+@click.option(
+    "-o",
+    "--output-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Write outputs here instead of next to each input.",
+)
+@click.option(
+    "--shard-size",
+    type=click.IntRange(0),
+    help="Split each file into chunks of this many pages converted in parallel.",
+)
+@click.option(
+    "--shard-workers",
+    type=click.IntRange(1),
+    help="Number of k2pdfopt processes per sharded file.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always run k2pdfopt, even if an identical conversion is cached.",
+)
+@click.option(
+    "--summary",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write a JSON summary of every conversion to this file.",
+)
+@click.argument(
+    "paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+def batch(
+    profile_name: str,
+    jobs: int,
+    output_dir: Optional[Path],
+    shard_size: Optional[int],
+    shard_workers: Optional[int],
+    no_cache: bool,
+    summary: Optional[Path],
+    paths: tuple[Path, ...],
+):
+    """Convert PATHS with a saved profile, without opening a window."""
+    from ._batch import record_history, run_batch, write_summary
+    from ._results import ResultCache
+
+    config = Config()
+    profile = resolve_profile(config, profile_name)
+
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    result_cache = None
+    if config["result_cache_bytes"] and not no_cache:
+        result_cache = ResultCache(CACHE_DIR / "outputs", config["result_cache_bytes"])
+
+    def report(result):
+        record_history(config.store, result)
+        size = "-" if result.output_bytes is None else f"{result.output_bytes}"
+        line = f"{result.status:6} {result.seconds:8.1f}s {size:>10}  {result.path}"
+        if callable(profile) and result.profile:
+            line += f" [{result.profile}]"
+        click.echo(line)
+        if result.message and result.status != "ok":
+            click.echo(f"       {result.message.splitlines()[-1]}", err=True)
+
+    results = run_batch(
+        paths,
+        profile,
+        jobs=jobs,
+        executable=config["k2pdfopt_path"],
+        output_dir=output_dir,
+        shard_size=config["shard_size"] if shard_size is None else shard_size,
+        shard_workers=shard_workers or config["shard_workers"],
+        result_cache=result_cache,
+        on_result=report,
+    )
+
+    if summary is not None:
+        write_summary(results, summary)
+
+    failed = sum(r.status != "ok" for r in results)
+    click.echo(f"{len(results) - failed} converted, {failed} failed")
+    if result_cache is not None:
+        click.echo(
+            f"result cache: {result_cache.hits} hits, {result_cache.misses} misses"
+        )
+
+    peak = peak_rss_bytes()
+    if peak is not None:
+        click.echo(f"peak resident memory: {peak / 1024**2:.0f} MB")
+    sys.exit(1 if failed else 0)
+
+
+@main.command()
+@click.option(
+    "--profile",
+    "profile_name",
+    default="Default",
+    show_default=True,
+    help=f"Saved profile to use, or {AUTO_PROFILE!r} to pick one by page layout.",
+)
+@click.option("-j", "--jobs", default=1, show_default=True, type=click.IntRange(1))
+@click.option(
+    "-o",
+    "--output-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Write outputs here instead of next to each input.",
+)
+@click.option(
+    "--settle",
+    default=2.0,
+    show_default=True,
+    type=click.FloatRange(0),
+    help="Seconds a new file's size must stay the same before it is converted.",
+)
+@click.option(
+    "--poll-interval",
+    default=5.0,
+    show_default=True,
+    type=click.FloatRange(0.1),
+    help="Seconds between directory scans when inotify is not available.",
+)
+@click.option(
+    "--polling", is_flag=True, help="Scan the directory even if inotify works."
+)
+@click.option(
+    "--state",
+    "state_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="File remembering converted files [default: DIR/.journal2ebook-watch.json]",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always run k2pdfopt, even if an identical conversion is cached.",
+)
+@click.argument(
+    "directory", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+def watch(
+    profile_name: str,
+    jobs: int,
+    output_dir: Optional[Path],
+    settle: float,
+    poll_interval: float,
+    polling: bool,
+    state_path: Optional[Path],
+    no_cache: bool,
+    directory: Path,
+):
+    """Convert every PDF that appears in DIRECTORY until interrupted."""
+    import functools
+    import signal
+
+    from ._batch import convert_file, record_history
+    from ._results import ResultCache
+    from ._watch import STATE_FILE, Watcher, WatchState
+
+    config = Config()
+    profile = resolve_profile(config, profile_name)
+
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    result_cache = None
+    if config["result_cache_bytes"] and not no_cache:
+        result_cache = ResultCache(CACHE_DIR / "outputs", config["result_cache_bytes"])
+
+    def report(result):
+        record_history(config.store, result)
+        line = f"{result.status:6} {result.seconds:8.1f}s  {result.path}"
+        if callable(profile) and result.profile:
+            line += f" [{result.profile}]"
+        click.echo(line)
+        if result.message and result.status != "ok":
+            click.echo(f"       {result.message.splitlines()[-1]}", err=True)
+
+    watcher = Watcher(
+        directory,
+        functools.partial(
+            convert_file,
+            profile=profile,
+            executable=config["k2pdfopt_path"],
+            output_dir=output_dir,
+            shard_size=config["shard_size"],
+            shard_workers=config["shard_workers"],
+            result_cache=result_cache,
+        ),
+        state=WatchState(state_path or directory / STATE_FILE),
+        jobs=jobs,
+        settle=settle,
+        poll_interval=poll_interval,
+        use_inotify=not polling,
+        on_result=report,
+    )
+
+    def stop(*_):
+        click.echo("Stopping; waiting for running conversions...", err=True)
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    watcher.run()
+
+    counters = watcher.counters
+    click.echo(f"{counters['converted']} converted, {counters['failed']} failed")
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True, type=click.IntRange(0))
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(1),
+    help="Conversions running at once [default: the queue's parallel jobs]",
+)
+@click.option(
+    "--max-queue",
+    default=100,
+    show_default=True,
+    type=click.IntRange(1),
+    help="Uploads waiting beyond this many are refused with 503.",
+)
+@click.option("--max-upload-mb", default=200, show_default=True, type=click.IntRange(1))
+@click.option(
+    "--retention",
+    default=3600.0,
+    show_default=True,
+    type=click.FloatRange(0),
+    help="Seconds a finished job and its output are kept for download.",
+)
+@click.option(
+    "--spool-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Where uploads and outputs are kept [default: a temporary directory]",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always run k2pdfopt, even if an identical conversion is cached.",
+)
+def serve(
+    host: str,
+    port: int,
+    jobs: Optional[int],
+    max_queue: int,
+    max_upload_mb: int,
+    retention: float,
+    spool_dir: Optional[Path],
+    no_cache: bool,
+):
+    """Accept PDFs over HTTP and convert them with saved profiles."""
+    import functools
+    import shutil
+    import signal
+    import tempfile
+    import threading
+
+    from ._results import ResultCache
+    from ._serve import ConversionService, Server
+
+    config = Config()
+    result_cache = None
+    if config["result_cache_bytes"] and not no_cache:
+        result_cache = ResultCache(CACHE_DIR / "outputs", config["result_cache_bytes"])
+
+    temporary = spool_dir is None
+    if spool_dir is None:
+        spool_dir = Path(tempfile.mkdtemp(prefix="journal2ebook-serve-"))
+    spool_dir.mkdir(parents=True, exist_ok=True)
+
+    service = ConversionService(
+        spool_dir,
+        functools.partial(profile_choice, config),
+        store=config.store,
+        workers=jobs or config["queue_workers"],
+        max_queue=max_queue,
+        retention=retention,
+        executable=config["k2pdfopt_path"],
+        shard_size=config["shard_size"],
+        shard_workers=config["shard_workers"],
+        result_cache=result_cache,
+    )
+    server = Server((host, port), service, max_upload=max_upload_mb * 1024**2)
+    # shutdown() blocks until serve_forever() returns, so not from its thread
+    signal.signal(
+        signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start()
+    )
+
+    bound_host, bound_port = server.server_address[:2]
+    click.echo(
+        f"Serving on http://{bound_host}:{bound_port}/ with {service.workers} workers",
+        err=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo("Stopping; cancelling running conversions...", err=True)
+        server.server_close()
+        service.close()
+        if temporary:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+@main.command()
+@click.option("--profile", "profile_name", help="Only conversions with this profile.")
+@click.option(
+    "--file",
+    "file_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Only conversions of this file (matched by content).",
+)
+@click.option("--days", type=click.FloatRange(0), help="Only the last DAYS days.")
+@click.option(
+    "-n",
+    "--limit",
+    default=50,
+    show_default=True,
+    type=click.IntRange(0),
+    help="At most this many rows; 0 for all.",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print JSON instead of a table.")
+def history(
+    profile_name: Optional[str],
+    file_path: Optional[Path],
+    days: Optional[float],
+    limit: int,
+    as_json: bool,
+):
+    """Show past conversions, most recent first."""
+    import json
+    import time
+
+    from ._diskcache import file_digest
+
+    rows = Config().store.history(
+        profile=profile_name,
+        file_hash=None if file_path is None else file_digest(file_path),
+        since=None if days is None else time.time() - days * 86400,
+        limit=limit or None,
+    )
+    if as_json:
+        click.echo(json.dumps(rows, indent=4))
+        return
+
+    for row in rows:
+        finished = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["finished_at"]))
+        pages = "-" if row["pages"] is None else row["pages"]
+        seconds = "-" if row["seconds"] is None else f"{row['seconds']:.1f}s"
+        click.echo(
+            f"{finished}  {row['status']:9} {seconds:>8} {pages:>5}p  "
+            f"{row['profile'] or '-':20} {row['path']}"
+        )
@@ -1,11 +1,21 @@
+import atexit
+import copy
 import json
+import logging
 import os
-from dataclasses import asdict, dataclass
+import threading
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 from appdirs import user_config_dir
 
+from ._exceptions import ProfileNotFoundError
+from ._store import Store
+from ._trace import span
+
+logger = logging.getLogger(__name__)
+
 NAME: str = "journal2ebook"
 
 CONFIG_FILE: str = "config.ini"
@@ -16,10 +26,18 @@ except Exception:
     # Fallback to a directory in the user's home folder
     CONFIG_DIR = Path.home() / f".{NAME}"
 
-print(f"Using config directory: {CONFIG_DIR}")
-
+# Settings and profiles of versions before the database; imported on first run
 CONFIG_PATH = CONFIG_DIR / CONFIG_FILE
 
+DATABASE_PATH = CONFIG_DIR / f"{NAME}.db"
+
+CACHE_DIR = CONFIG_DIR / "cache"
+
+# Seconds to wait after a change before writing to the database, so that the
+# several assignments made by a single UI action end up in one transaction
+SAVE_DELAY = 1.0
+
+
 def parse(dct: dict[str, Any]) -> Any:
     if "__path__" in dct:
         return Path(dct["path"])
@@ -28,6 +46,7 @@ def parse(dct: dict[str, Any]) -> Any:
         return Profile(**dct)
     return dct
 
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, obj: Any):
         if isinstance(obj, Path):
@@ -38,6 +57,7 @@ class JSONEncoder(json.JSONEncoder):
             return ret
         return super().default(obj)
 
+
 @dataclass
 class Profile:
     name: str
@@ -48,53 +68,192 @@ class Profile:
     rightmargin: float = 1.0
     topmargin: float = 0.0
     bottommargin: float = 1.0
+    # Layout fingerprints of documents this profile was saved for, used to
+    # pick it automatically (see _fingerprint)
+    fingerprints: list[str] = field(default_factory=list)
 
     def __str__(self):
         return self.name
 
-CONFIG_DEFAULT = {
+
+CONFIG_DEFAULT: dict[str, Any] = {
     "last_dir": Path("~"),
     "last_profile": 0,
     "profiles": [Profile("Default")],
     "k2pdfopt_path": None,
+    "page_cache_pages": 16,
+    "page_cache_bytes": 256 * 1024**2,
+    "tile_cache_bytes": 64 * 1024**2,
+    "preview_cache_bytes": 512 * 1024**2,
+    "low_memory": False,
+    "renderer": "pdf2image",
+    "grayscale_previews": False,
+    "memory_limit_bytes": None,
+    "result_cache_bytes": 1024**3,
+    "prefetch_pages": 3,
+    "prefetch_workers": 2,
+    "shard_size": 0,
+    "shard_workers": os.cpu_count() or 1,
+    "auto_margin_samples": 50,
+    "queue_workers": 2,
+    "auto_select_profile": True,
+    "output_preview": False,
+    "output_preview_cache_bytes": 64 * 1024**2,
+    "thumbnails": True,
+    "thumbnail_cache_pages": 64,
 }
 
+
 class Config:
     def __init__(self):
-        self._path = CONFIG_PATH
-        self._config = CONFIG_DEFAULT.copy()  # Use a copy to avoid modifying the original
+        self._path = DATABASE_PATH
+        self._config = copy.deepcopy(CONFIG_DEFAULT)
+
+        # What the database holds, so that a save only writes changed rows
+        self._stored_settings: dict[str, str] = {}
+        self._stored_profiles: dict[str, tuple[int, dict[str, Any]]] = {}
+
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
 
-        print(f"Config file should be located at: {self._path}")
-        print(f"Config directory exists: {os.path.exists(self._path.parent)}")
-        print(f"Config file exists: {os.path.exists(self._path)}")
+        self.store = Store(self._path)
+        atexit.register(self.flush)
 
         self.load()
 
     def save(self):
-        try:
-            os.makedirs(self._path.parent, exist_ok=True)
-            with open(self._path, "w", encoding="utf-8") as cfg:
-                json.dump(self._config, cfg, indent=4, cls=JSONEncoder)
-            print(f"Config saved successfully to {self._path}")
-            print(f"Saved profiles: {[p.name for p in self._config['profiles']]}")
-            print(f"Last profile index: {self._config['last_profile']}")
-        except Exception as e:
-            print(f"Error saving config to {self._path}: {str(e)}")
+        with self._lock:
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(SAVE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+
+            try:
+                with span("config_save"):
+                    self._write()
+            except Exception:
+                logger.exception("Error saving config to %s", self._path)
+
+    def _write(self):
+        settings = []
+        for key, value in self._config.items():
+            if key == "profiles":
+                continue
+            text = json.dumps(value, cls=JSONEncoder)
+            if self._stored_settings.get(key) != text:
+                settings.append((key, text))
+
+        profiles = {}
+        for position, profile in enumerate(self._config["profiles"]):
+            if profile.name in profiles:
+                logger.warning("Not saving duplicate profile name %s", profile.name)
+                continue
+            profiles[profile.name] = (position, asdict(profile))
+        changed = [
+            row
+            for name, row in profiles.items()
+            if self._stored_profiles.get(name) != row
+        ]
+        deleted = self._stored_profiles.keys() - profiles.keys()
+
+        if settings or changed or deleted:
+            self.store.write(
+                settings=settings, profiles=changed, deleted_profiles=deleted
+            )
+            logger.debug(
+                "Saved %d settings and %d profiles, deleted %d profiles",
+                len(settings),
+                len(changed),
+                len(deleted),
+            )
+        self._stored_settings.update(settings)
+        self._stored_profiles = profiles
 
     def load(self):
+        if self.store.created and CONFIG_PATH.exists():
+            self._import(CONFIG_PATH)
+            return
+
+        for key, text in self.store.settings().items():
+            try:
+                self._config[key] = json.loads(text, object_hook=parse)
+            except json.JSONDecodeError:
+                logger.warning("Ignoring undecodable setting %s", key)
+                continue
+            self._stored_settings[key] = text
+
+        rows = self.store.profiles()
+        if rows:
+            self._config["profiles"] = [Profile(**row) for row in rows]
+            self._stored_profiles = {
+                row["name"]: (position, row) for position, row in enumerate(rows)
+            }
+        else:
+            # Store the default profile, so it can be looked up by name
+            self._dirty = True
+            self.flush()
+        self._check_last_profile()
+        logger.debug("Config loaded from %s", self._path)
+
+    def _import(self, path: Path):
+        # The JSON config.ini of earlier versions is read once and left in place
         try:
-            with open(self._path, "r", encoding="utf-8") as cfg:
-                loaded_config = json.load(cfg, object_hook=parse)
-                self._config.update(loaded_config)  # Update instead of replace
-            print(f"Config loaded successfully from {self._path}")
-            print(f"Loaded profiles: {[p.name for p in self._config['profiles']]}")
-            print(f"Last profile index: {self._config['last_profile']}")
-        except FileNotFoundError:
-            print(f"Config file not found at {self._path}. Using default configuration.")
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON from {self._path}. Using default configuration.")
-        except Exception as e:
-            print(f"Error loading config from {self._path}: {str(e)}. Using default configuration.")
+            with open(path, "r", encoding="utf-8") as cfg:
+                self._config.update(json.load(cfg, object_hook=parse))
+        except Exception:
+            logger.exception("Error importing %s, using the defaults", path)
+        else:
+            logger.info("Imported %s into %s", path, self._path)
+        self._rename_duplicate_profiles()
+        self._check_last_profile()
+        self._dirty = True
+        self.flush()
+
+    def _rename_duplicate_profiles(self):
+        # Profiles are stored by name; config.ini allowed the same name twice
+        names: set[str] = set()
+        for profile in self._config["profiles"]:
+            name = profile.name
+            copy_number = 1
+            while name in names:
+                copy_number += 1
+                name = f"{profile.name} ({copy_number})"
+            if name != profile.name:
+                logger.warning(
+                    "Renaming duplicate profile %s to %s", profile.name, name
+                )
+                profile.name = name
+            names.add(name)
+
+    def _check_last_profile(self):
+        # The GUI selects the last profile by its position
+        if not self._config["profiles"]:
+            self._config["profiles"] = [Profile("Default")]
+        last_profile = self._config["last_profile"]
+        if not isinstance(last_profile, int) or not (
+            0 <= last_profile < len(self._config["profiles"])
+        ):
+            logger.warning("Ignoring out of range last_profile %s", last_profile)
+            self._config["last_profile"] = 0
+
+    def find_profile(self, name: str) -> Profile:
+        self.flush()
+        row = self.store.profile(name)
+        if row is None:
+            msg = f"No profile named {name!r}"
+            raise ProfileNotFoundError(msg)
+        return Profile(**row)
 
     def __getitem__(self, name: str) -> Any:
         return self._config.get(name)
@@ -102,6 +261,3 @@ class Config:
     def __setitem__(self, name: str, value: Any):
         self._config[name] = value
         self.save()
-
-# Initialize the config
-config = Config()
@@ -0,0 +1,469 @@
+import abc
+import collections
+import functools
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Callable, Optional, Union
+
+from ._config import Profile
+from ._results import ResultCache
+from ._trace import record, span
+
+# k2pdfopt announces every source page it starts working on
+PROGRESS_PATTERN = re.compile(r"SOURCE PAGE\s+(\d+)")
+
+STDERR_LINES = 50
+
+# poppler ships pdfunite alongside the pdftoppm that pdf2image already needs
+MERGE_EXECUTABLE = "pdfunite"
+
+# Appended to the input's stem to name the converted file
+OUTPUT_SUFFIX = "_output"
+
+
+def output_path(path: Path) -> Path:
+    return path.with_stem(path.stem + OUTPUT_SUFFIX)
+
+
+# Conversions write here and rename the result over the output once it is
+# complete, so a failed or cancelled run leaves an existing output alone
+def partial_path(output: Path) -> Path:
+    return output.with_stem(f".{output.stem}.partial")
+
+
+def page_range(profile: Profile, num_pages: int) -> tuple[int, int]:
+    return int(profile.skip_first_page) + 1, num_pages
+
+
+def shard_ranges(first: int, last: int, shard_size: int) -> list[tuple[int, int]]:
+    return [
+        (start, min(start + shard_size - 1, last))
+        for start in range(first, last + 1, shard_size)
+    ]
+
+
+def k2pdfopt_args(
+    path: Path,
+    profile: Profile,
+    num_pages: int,
+    *,
+    executable: Optional[str] = None,
+    pages: Optional[tuple[int, int]] = None,
+    output: Optional[Path] = None,
+) -> list[str]:
+    first, last = pages or page_range(profile, num_pages)
+    return [
+        executable or "k2pdfopt",
+        "-x",
+        "-c" if profile.color else "-c-",
+        "-p",
+        f"{first}-{last}",
+        "-col",
+        f"{2 + 2 * int(profile.many_cols)}",
+        "-ml",
+        f"{8.5 * profile.leftmargin:.3f}",
+        "-mr",
+        f"{8.5 * (1 - profile.rightmargin):.3f}",
+        "-mt",
+        f"{11 * profile.topmargin:.3f}",
+        "-mb",
+        f"{11 * (1 - profile.bottommargin):.3f}",
+        "-ui-",
+        "-o",
+        f"{output or output_path(path)}",
+        str(path),
+    ]
+
+
+class BaseJob(abc.ABC):
+    first_page: int
+    last_page: int
+    pages_done: int
+
+    def __init__(self, *, pages: tuple[int, int]):
+        self.first_page, self.last_page = pages
+
+        self.cancelled = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self._finish_lock = threading.Lock()
+
+        # Run on the job's thread after a successful run, before on_finished
+        self.on_success: list[Callable[[], None]] = []
+        # Run on the job's thread with the job once it is done, whatever the
+        # outcome
+        self.on_finished: list[Callable[[BaseJob], None]] = []
+
+    @property
+    @abc.abstractmethod
+    def stderr(self) -> str: ...
+
+    @abc.abstractmethod
+    def start(self): ...
+
+    @abc.abstractmethod
+    def cancel(self): ...
+
+    @abc.abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]: ...
+
+    @property
+    def total_pages(self) -> int:
+        return max(self.last_page - self.first_page + 1, 1)
+
+    @property
+    def done(self) -> bool:
+        return self.returncode is not None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.cancelled
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def eta(self) -> Optional[float]:
+        if not self.pages_done or self.done:
+            return None
+        per_page = self.elapsed / self.pages_done
+        return per_page * (self.total_pages - self.pages_done)
+
+    def _set_finished(self, returncode: int):
+        # The callbacks run once, even if two threads finish the job at once
+        with self._finish_lock:
+            if self.returncode is not None:
+                return
+            self.finished_at = time.monotonic()
+            self.returncode = returncode
+        if returncode == 0 and not self.cancelled:
+            for on_success in self.on_success:
+                on_success()
+        for on_finished in self.on_finished:
+            on_finished(self)
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        return "ok" if self.ok else "failed"
+
+
+class ConversionJob(BaseJob):
+    def __init__(
+        self, args: list[str], *, pages: tuple[int, int], output: Optional[Path] = None
+    ):
+        super().__init__(pages=pages)
+        self.args = args
+        # If given, the file k2pdfopt writes is renamed to it after a success
+        self.output = output
+        self.pages_done = 0
+
+        self._stderr: collections.deque[str] = collections.deque(maxlen=STDERR_LINES)
+        self._process: Optional[subprocess.Popen] = None
+        self._readers: list[threading.Thread] = []
+        self._waiter: Optional[threading.Thread] = None
+
+    @property
+    def stderr(self) -> str:
+        return "".join(self._stderr)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._process = subprocess.Popen(
+            self.args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+        self._readers = [
+            threading.Thread(
+                target=self._read_stdout, args=(self._process.stdout,), daemon=True
+            ),
+            threading.Thread(
+                target=self._read_stderr, args=(self._process.stderr,), daemon=True
+            ),
+        ]
+        for reader in self._readers:
+            reader.start()
+        self._waiter = threading.Thread(target=self._wait, daemon=True)
+        self._waiter.start()
+
+    def cancel(self):
+        if self._process is not None and self._process.poll() is not None:
+            return
+        self.cancelled = True
+        if self._process is not None:
+            self._process.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        # Only the waiter thread finishes the job
+        if self._waiter is not None:
+            self._waiter.join(timeout)
+        return self.returncode
+
+    def _read_stdout(self, stream: IO[str]):
+        for line in stream:
+            match = PROGRESS_PATTERN.search(line)
+            if match is not None:
+                page = int(match.group(1)) - self.first_page + 1
+                self.pages_done = max(self.pages_done, min(page, self.total_pages))
+
+    def _read_stderr(self, stream: IO[str]):
+        for line in stream:
+            self._stderr.append(line)
+
+    def _wait(self):
+        assert self._process is not None
+        self._process.wait()
+        for reader in self._readers:
+            reader.join()
+        self._finish()
+
+    def _finish(self):
+        if self._process is None or self._process.returncode is None:
+            return
+        returncode = self._process.returncode
+        if returncode == 0 and not self.cancelled:
+            self.pages_done = self.total_pages
+        if self.output is not None:
+            returncode = self._replace_output(returncode)
+        self._set_finished(returncode)
+        record(
+            "k2pdfopt",
+            self.elapsed,
+            pages=f"{self.first_page}-{self.last_page}",
+            returncode=self.returncode,
+            cancelled=self.cancelled,
+        )
+
+    def _replace_output(self, returncode: int) -> int:
+        assert self.output is not None
+        # args end in "-o", the file k2pdfopt writes, and the input
+        written = Path(self.args[-2])
+        try:
+            if returncode == 0 and not self.cancelled:
+                os.replace(written, self.output)
+        except OSError as e:
+            self._stderr.append(f"{e}\n")
+            return -1
+        finally:
+            written.unlink(missing_ok=True)
+        return returncode
+
+
+class ShardedConversionJob(BaseJob):
+    def __init__(
+        self,
+        path: Path,
+        profile: Profile,
+        num_pages: int,
+        *,
+        shards: list[tuple[int, int]],
+        workers: int,
+        executable: Optional[str] = None,
+        output: Optional[Path] = None,
+    ):
+        super().__init__(pages=(shards[0][0], shards[-1][1]))
+        self.path = path
+        self.profile = profile
+        self.num_pages = num_pages
+        self.shards = shards
+        self.workers = workers
+        self.executable = executable
+        self.output = output or output_path(path)
+
+        self._jobs: list[ConversionJob] = []
+        self._failed = False
+        self._merge_stderr = ""
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pages_done(self) -> int:  # type: ignore[override]
+        return sum(job.pages_done for job in self._jobs)
+
+    @property
+    def stderr(self) -> str:
+        failed = [job.stderr for job in self._failed_jobs()]
+        return "".join(failed) + self._merge_stderr
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+        for job in self._jobs:
+            job.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.returncode
+
+    def _run(self):
+        tmpdir = Path(tempfile.mkdtemp(prefix="journal2ebook-"))
+        try:
+            outputs = [tmpdir / f"shard{i:05d}.pdf" for i in range(len(self.shards))]
+            self._jobs = [
+                ConversionJob(
+                    k2pdfopt_args(
+                        self.path,
+                        self.profile,
+                        self.num_pages,
+                        executable=self.executable,
+                        pages=pages,
+                        output=output,
+                    ),
+                    pages=pages,
+                )
+                for pages, output in zip(self.shards, outputs)
+            ]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(self._run_shard, self._jobs))
+
+            if self.cancelled or self._failed:
+                failed = [
+                    job.returncode
+                    for job in self._failed_jobs()
+                    if job.returncode is not None
+                ]
+                returncode = failed[0] if failed else -1
+            else:
+                returncode = self._merge(outputs)
+        except OSError as e:
+            self._merge_stderr = str(e)
+            returncode = -1
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        self._set_finished(returncode)
+
+    def _failed_jobs(self) -> list[ConversionJob]:
+        return [
+            job for job in self._jobs if job.done and not job.ok and not job.cancelled
+        ]
+
+    def _run_shard(self, job: ConversionJob):
+        if self.cancelled or self._failed:
+            return
+        job.start()
+        if job.wait() != 0 and not self.cancelled:
+            # One missing shard spoils the merged output; stop the others early
+            self._failed = True
+            for other in self._jobs:
+                if other is not job:
+                    other.cancel()
+
+    def _merge(self, outputs: list[Path]) -> int:
+        partial = partial_path(self.output)
+        try:
+            if len(outputs) == 1:
+                shutil.move(outputs[0], partial)
+                returncode = 0
+            else:
+                with span("merge", shards=len(outputs)):
+                    result = subprocess.run(
+                        [MERGE_EXECUTABLE, *map(str, outputs), str(partial)],
+                        stdin=subprocess.DEVNULL,
+                        capture_output=True,
+                        text=True,
+                        errors="replace",
+                        check=False,
+                    )
+                self._merge_stderr = result.stderr
+                returncode = result.returncode
+            if returncode == 0:
+                os.replace(partial, self.output)
+        finally:
+            partial.unlink(missing_ok=True)
+        return returncode
+
+
+class CachedJob(BaseJob):
+    def __init__(self, fetch: Callable[[], None], *, pages: tuple[int, int]):
+        super().__init__(pages=pages)
+        self.pages_done = 0
+        self._stderr = ""
+        self._fetch = fetch
+
+    @property
+    def stderr(self) -> str:
+        return self._stderr
+
+    def start(self):
+        self.started_at = time.monotonic()
+        try:
+            self._fetch()
+        except OSError as e:
+            self._stderr = str(e)
+            self._set_finished(-1)
+        else:
+            self.pages_done = self.total_pages
+            self._set_finished(0)
+
+    def cancel(self):
+        pass
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        return self.returncode
+
+
+def conversion_job(
+    path: Path,
+    profile: Profile,
+    num_pages: int,
+    *,
+    executable: Optional[str] = None,
+    output: Optional[Path] = None,
+    shard_size: int = 0,
+    workers: int = 1,
+    result_cache: Optional[ResultCache] = None,
+    digest: Optional[str] = None,
+) -> Union[CachedJob, ConversionJob, ShardedConversionJob]:
+    output = output or output_path(path)
+    pages = page_range(profile, num_pages)
+    shards = shard_ranges(*pages, shard_size) if shard_size > 0 else [pages]
+    args = k2pdfopt_args(
+        path, profile, num_pages, executable=executable, output=partial_path(output)
+    )
+
+    job: Union[CachedJob, ConversionJob, ShardedConversionJob]
+    if result_cache is not None:
+        key = result_cache.key(path, args, digest=digest)
+        cached = result_cache.lookup(key)
+        if cached is not None:
+            return CachedJob(
+                functools.partial(result_cache.restore, cached, output), pages=pages
+            )
+
+    if len(shards) <= 1 or workers <= 1:
+        job = ConversionJob(args, pages=pages, output=output)
+    else:
+        job = ShardedConversionJob(
+            path,
+            profile,
+            num_pages,
+            shards=shards,
+            workers=workers,
+            executable=executable,
+            output=output,
+        )
+
+    if result_cache is not None:
+        job.on_success.append(functools.partial(result_cache.store, key, output))
+    return job
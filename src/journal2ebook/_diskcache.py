@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+CHUNK_SIZE = 1024**2
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts: object) -> str:
+    return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()
+
+
+# A directory of files that is kept below max_bytes by removing the least
+# recently used entries. Recency is the file's mtime, which is bumped on a hit.
+class DiskCache:
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str, suffix: str = "") -> Path:
+        return self.directory / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = "") -> Optional[Path]:
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, suffix: str, write: Callable[[Path], object]) -> Path:
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write next to the final location and rename, so readers never see a
+        # partially written entry.
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(Path(tmp))
+            with self._lock:
+                # An overwritten entry no longer counts towards the size
+                try:
+                    replaced = path.stat().st_size
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, path)
+                if self._size is None:
+                    self._size = sum(p.stat().st_size for p in self._entries())
+                else:
+                    self._size += path.stat().st_size - replaced
+                if self._size > self.max_bytes:
+                    self._evict()
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return path
+
+    def _entries(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return [
+            p for p in self.directory.glob("*/*") if p.is_file() and p.suffix != ".tmp"
+        ]
+
+    def _evict(self):
+        entries = sorted(
+            ((p.stat(), p) for p in self._entries()), key=lambda e: e[0].st_mtime
+        )
+        size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+        self._size = size
@@ -0,0 +1,144 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Optional
+
+from ._cache import LRUCache, image_nbytes
+from ._diskcache import DiskCache, file_digest, make_key
+from ._render import DEFAULT_RENDERER, Box, make_renderer
+from ._trace import span
+
+# US letter, in points; used when poppler does not report a page size
+DEFAULT_PAGE_SIZE = (612.0, 792.0)
+
+
+def parse_page_size(value: Optional[str]) -> tuple[float, float]:
+    # pdfinfo reports e.g. "612 x 792 pts (letter)"
+    match = re.match(r"\s*([\d.]+) x ([\d.]+)", value or "")
+    if match is None:
+        return DEFAULT_PAGE_SIZE
+    return float(match.group(1)), float(match.group(2))
+
+
+class Document:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        cache_pages: Optional[int] = None,
+        cache_bytes: Optional[int] = None,
+        disk_cache: Optional[DiskCache] = None,
+        grayscale: bool = False,
+        low_memory: bool = False,
+        renderer: str = DEFAULT_RENDERER,
+    ):
+        self.path = path
+        self.grayscale = grayscale
+        self._renderer = make_renderer(
+            renderer, path, grayscale=grayscale, low_memory=low_memory
+        )
+
+        self._disk_cache = disk_cache
+        self.digest = None if disk_cache is None else file_digest(path)
+
+        info = self._pdfinfo()
+        self.num_pages: int = int(info["Pages"])
+        self.page_size = parse_page_size(info.get("Page size"))
+
+        self._previews = LRUCache(
+            max_items=cache_pages, max_bytes=cache_bytes, sizeof=image_nbytes
+        )
+
+    @property
+    def aspect(self) -> float:
+        return self.page_size[0] / self.page_size[1]
+
+    @property
+    def mode(self) -> str:
+        return "L" if self.grayscale else "RGB"
+
+    @property
+    def renderer(self) -> str:
+        return self._renderer.name
+
+    def trim(self):
+        self._previews.clear()
+
+    def close(self):
+        self._renderer.close()
+
+    def _pdfinfo(self) -> dict[str, Any]:
+        if self._disk_cache is None:
+            with span("pdfinfo", renderer=self.renderer):
+                return self._renderer.pdfinfo()
+
+        key = make_key(self.digest, "pdfinfo")
+        cached = self._disk_cache.get(key, ".json")
+        if cached is not None:
+            with open(cached, encoding="utf-8") as f:
+                return json.load(f)
+
+        with span("pdfinfo", renderer=self.renderer):
+            info = self._renderer.pdfinfo()
+        self._disk_cache.put(
+            key, ".json", lambda tmp: tmp.write_text(json.dumps(info), "utf-8")
+        )
+        return info
+
+    def cached_preview(self, number: int, height: int) -> Any:
+        key = (number, height)
+        img = self._previews.get(key)
+        if img is not None or self._disk_cache is None:
+            return img
+
+        cached = self._disk_cache.get(
+            make_key(self.digest, number, height, self.mode), ".png"
+        )
+        if cached is None:
+            return None
+
+        from PIL import Image
+
+        try:
+            with span("preview_decode", page=number), Image.open(cached) as f:
+                img = f.convert(self.mode)
+        except OSError:
+            return None
+        self._previews[key] = img
+        return img
+
+    def preview(self, number: int, height: int) -> Any:
+        img = self.cached_preview(number, height)
+        if img is None:
+            # Let the renderer scale directly to the display height instead of
+            # rendering at full resolution and resampling afterwards.
+            img = self.render(number, size=(None, height))
+            self._previews[number, height] = img
+            if self._disk_cache is not None:
+                self._disk_cache.put(
+                    make_key(self.digest, number, height, self.mode),
+                    ".png",
+                    lambda tmp: img.save(tmp, "PNG", compress_level=1),
+                )
+        return img
+
+    def render(
+        self,
+        number: int,
+        *,
+        dpi: int = 200,
+        size: Optional[tuple[Optional[int], Optional[int]]] = None,
+    ) -> Any:
+        self._check_page(number)
+        with span("rasterize", page=number, size=size, renderer=self.renderer):
+            return self._renderer.render(number, dpi=dpi, size=size)
+
+    def tile(self, number: int, height: int, box: Box) -> Any:
+        self._check_page(number)
+        with span("rasterize_tile", page=number, box=box, renderer=self.renderer):
+            return self._renderer.render_region(number, height=height, box=box)
+
+    def _check_page(self, number: int):
+        if not 1 <= number <= self.num_pages:
+            msg = f"Page {number} is out of range (1-{self.num_pages})"
+            raise IndexError(msg)
@@ -1,2 +1,10 @@
 class NoPdfSelectedError(Exception):
     pass
+
+
+class ProfileNotFoundError(Exception):
+    pass
+
+
+class QueueFullError(Exception):
+    pass
@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from ._config import Profile
+
+# A fingerprint is a difference hash of each of the first PAGES pages, stored as
+# one hex string. Shorter documents repeat their last page, so fingerprints
+# always have the same length and can be compared bit by bit.
+PAGES = 3
+HASH_SIZE = 8
+PAGE_BYTES = HASH_SIZE * HASH_SIZE // 8
+# Height at which pages are rendered for fingerprinting
+RENDER_HEIGHT = 200
+
+# Fraction of differing bits above which a profile is not considered a match
+MAX_DISTANCE = 0.2
+
+# Below this a new fingerprint is not worth keeping next to an existing one
+SAME_LAYOUT = 0.05
+
+# Profiles remember this many layouts; the oldest is dropped first
+MAX_FINGERPRINTS = 8
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def page_hash(img: Any) -> bytes:
+    # Compares neighbouring cells of a heavily reduced grayscale page, which
+    # keeps the arrangement of columns, headers and figures but not the text.
+    from PIL import Image
+
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes()
+
+
+def fingerprint(images: list[Any]) -> str:
+    if not images:
+        msg = "Cannot fingerprint a document without pages"
+        raise ValueError(msg)
+    images = images[:PAGES] + [images[-1]] * (PAGES - len(images))
+    return b"".join(page_hash(img) for img in images).hex()
+
+
+def fingerprint_pdf(path: Path, *, first_page: int = 1) -> str:
+    import pdf2image
+
+    images = pdf2image.convert_from_path(
+        path,
+        first_page=first_page,
+        last_page=first_page + PAGES - 1,
+        size=(None, RENDER_HEIGHT),
+        grayscale=True,
+    )
+    return fingerprint(images)
+
+
+def fingerprint_document(document: Any) -> str:
+    count = min(PAGES, document.num_pages)
+    return fingerprint(
+        [document.render(n, size=(None, RENDER_HEIGHT)) for n in range(1, count + 1)]
+    )
+
+
+def remember(profile: Profile, value: str) -> bool:
+    # Adds a layout to the profile unless it already has a near-identical one
+    index = FingerprintIndex([profile])
+    if len(index) and index.distances(value).min() <= SAME_LAYOUT:
+        return False
+    profile.fingerprints = [*profile.fingerprints, value][-MAX_FINGERPRINTS:]
+    return True
+
+
+class FingerprintIndex:
+    # All fingerprints of all profiles as one bit matrix, so a lookup is a
+    # single vectorized XOR and popcount however many profiles there are.
+    def __init__(self, profiles: list[Profile]):
+        self._profiles: list[Profile] = []
+        rows = []
+        for profile in profiles:
+            for value in profile.fingerprints:
+                row = bytes.fromhex(value)
+                if len(row) == PAGES * PAGE_BYTES:
+                    rows.append(row)
+                    self._profiles.append(profile)
+
+        self._matrix = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(
+            len(rows), PAGES * PAGE_BYTES
+        )
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def distances(self, value: str) -> np.ndarray:
+        query = np.frombuffer(bytes.fromhex(value), dtype=np.uint8)
+        differing = _POPCOUNT[self._matrix ^ query].sum(axis=1, dtype=np.int64)
+        return differing / (PAGES * PAGE_BYTES * 8)
+
+    def nearest(
+        self, value: str, *, max_distance: float = MAX_DISTANCE
+    ) -> Optional[Profile]:
+        if not self._profiles or len(value) != 2 * PAGES * PAGE_BYTES:
+            return None
+        distances = self.distances(value)
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+        return self._profiles[best]
+
+
+def profile_selector(
+    profiles: list[Profile], *, default: Optional[Profile] = None
+) -> Callable[[Path], Profile]:
+    # For the batch and watch commands: picks the profile for each file
+    index = FingerprintIndex(profiles)
+
+    def select(path: Path) -> Profile:
+        profile = index.nearest(fingerprint_pdf(path))
+        if profile is not None:
+            return profile
+        if default is not None:
+            return default
+        msg = f"No profile matches the layout of {path.name}"
+        raise LookupError(msg)
+
+    return select
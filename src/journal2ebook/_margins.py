@@ -0,0 +1,93 @@
+from typing import Any, Optional
+
+import numpy as np
+
+# Pages are analysed at this size; margins need no more detail than that
+SAMPLE_SIZE = (150, 200)
+
+# Gray values below this count as ink
+INK_THRESHOLD = 200
+# A row or column with less than this fraction of ink pixels counts as empty
+MIN_INK = 0.005
+
+# A band of content at the edge of the page no taller (wider) than MAX_BAND and
+# separated from the rest by at least MIN_GAP is a running header, footer, page
+# number or marginal note rather than part of the text body.
+MAX_BAND = 0.05
+MIN_GAP = 0.01
+
+# Fraction of pages that may stick out of the proposed box on each side
+OUTLIER_QUANTILE = 0.1
+
+PADDING = 0.01
+
+
+def sample_pages(first: int, last: int, count: int) -> list[int]:
+    if last - first + 1 <= count:
+        return list(range(first, last + 1))
+    return sorted({round(n) for n in np.linspace(first, last, count).tolist()})
+
+
+def _runs(mask: np.ndarray) -> list[tuple[int, int]]:
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > 1)
+    starts = np.r_[idx[0], idx[breaks + 1]]
+    ends = np.r_[idx[breaks], idx[-1]] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _body_extent(mask: np.ndarray) -> Optional[tuple[int, int]]:
+    bands = _runs(mask)
+    if not bands:
+        return None
+
+    n = mask.size
+    max_band, min_gap = MAX_BAND * n, MIN_GAP * n
+
+    while len(bands) > 1:
+        (start, end), (next_start, _) = bands[0], bands[1]
+        if end - start > max_band or next_start - end < min_gap:
+            break
+        bands.pop(0)
+
+    while len(bands) > 1:
+        (_, prev_end), (start, end) = bands[-2], bands[-1]
+        if end - start > max_band or start - prev_end < min_gap:
+            break
+        bands.pop()
+
+    return bands[0][0], bands[-1][1]
+
+
+def detect_margins(images: list[Any]) -> Optional[tuple[float, float, float, float]]:
+    if not images:
+        return None
+
+    pages = np.stack(
+        [np.asarray(img.convert("L").resize(SAMPLE_SIZE)) for img in images]
+    )
+    _, height, width = pages.shape
+
+    # Row and column ink projections of all pages at once
+    ink = pages < INK_THRESHOLD
+    rows = ink.mean(axis=2) > MIN_INK
+    cols = ink.mean(axis=1) > MIN_INK
+
+    bounds = []
+    for page_rows, page_cols in zip(rows, cols):
+        y = _body_extent(page_rows)
+        x = _body_extent(page_cols)
+        if x is not None and y is not None:
+            bounds.append((x[0] / width, x[1] / width, y[0] / height, y[1] / height))
+    if not bounds:
+        return None
+
+    left, right, top, bottom = np.asarray(bounds).T
+    return (
+        max(float(np.quantile(left, OUTLIER_QUANTILE)) - PADDING, 0.0),
+        min(float(np.quantile(right, 1 - OUTLIER_QUANTILE)) + PADDING, 1.0),
+        max(float(np.quantile(top, OUTLIER_QUANTILE)) - PADDING, 0.0),
+        min(float(np.quantile(bottom, 1 - OUTLIER_QUANTILE)) + PADDING, 1.0),
+    )
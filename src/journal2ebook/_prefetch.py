@@ -0,0 +1,134 @@
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_MS = 15
+
+
+def run_in_background(
+    widget: Any, func: Callable[[], Any], on_done: Callable[[Future], None]
+):
+    # Runs func on its own thread and calls on_done with the finished future on
+    # the Tk thread
+    future: Future = Future()
+
+    def work():
+        try:
+            future.set_result(func())
+        except BaseException as e:  # noqa: BLE001
+            future.set_exception(e)
+
+    def poll():
+        if future.done():
+            on_done(future)
+        else:
+            widget.after(POLL_INTERVAL_MS, poll)
+
+    threading.Thread(target=work, daemon=True).start()
+    widget.after(POLL_INTERVAL_MS, poll)
+
+
+# Renders pages (or anything else identified by a key, such as tiles) on a thread
+# pool. Worker threads never touch Tk: finished futures are pushed onto a queue
+# that the Tk thread drains with after().
+class Prefetcher:
+    def __init__(
+        self,
+        widget: Any,
+        on_ready: Callable[[Any, Any], None],
+        *,
+        workers: int = 2,
+    ):
+        self._widget = widget
+        self._on_ready = on_ready
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="journal2ebook-prefetch"
+        )
+        self._render: Optional[Callable[[Any], Any]] = None
+        self._results: queue.SimpleQueue = queue.SimpleQueue()
+        self._pending: dict[Hashable, Future] = {}
+        self._generation = 0
+        self._poll_id: Optional[str] = None
+
+    def reset(self, render: Optional[Callable[[Any], Any]]):
+        # Results of the previous generation are dropped when they arrive
+        self._generation += 1
+        self._render = render
+        self.cancel()
+
+    def request(self, numbers: Iterable[Hashable]):
+        if self._render is None:
+            return
+
+        numbers = list(numbers)
+        self.cancel(keep=numbers)
+
+        for number in numbers:
+            if number in self._pending:
+                continue
+            future = self._executor.submit(self._render, number)
+            future.add_done_callback(
+                functools.partial(self._done, self._generation, number)
+            )
+            self._pending[number] = future
+
+        if self._pending:
+            self._schedule_poll()
+
+    def cancel(self, keep: Iterable[Hashable] = ()):
+        keep = set(keep)
+        for number in list(self._pending):
+            if number not in keep and self._pending[number].cancel():
+                del self._pending[number]
+
+    def running(self) -> list[Future]:
+        # Renders that can no longer be cancelled, to wait for before closing
+        # what they render from
+        return [future for future in self._pending.values() if not future.done()]
+
+    def shutdown(self):
+        self._generation += 1
+        self._pending.clear()
+        if self._poll_id is not None:
+            self._widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, generation: int, number: Hashable, future: Future):
+        # Runs on a worker thread
+        if not future.cancelled():
+            self._results.put((generation, number, future))
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self._widget.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+
+        while True:
+            try:
+                generation, number, future = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            # A render that was already running when reset() was called stays
+            # pending until it finishes, and must not block requesting it again
+            if self._pending.get(number) is future:
+                del self._pending[number]
+            if generation != self._generation:
+                continue
+
+            error = future.exception()
+            if error is not None:
+                logger.error("Failed to render %s: %s", number, error)
+                continue
+            self._on_ready(number, future.result())
+
+        if self._pending:
+            self._schedule_poll()
@@ -0,0 +1,158 @@
+import enum
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from ._config import Profile
+from ._convert import BaseJob
+
+logger = logging.getLogger(__name__)
+
+
+class State(enum.Enum):
+    QUEUED = "queued"
+    STARTING = "starting"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED = (State.DONE, State.FAILED, State.CANCELLED)
+
+
+class QueueEntry:
+    def __init__(self, path: Path, profile: Profile):
+        self.path = path
+        self.profile = profile
+        self.state = State.QUEUED
+        self.job: Optional[BaseJob] = None
+        self.error = ""
+        self._cancelled = False
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED
+
+    @property
+    def progress(self) -> str:
+        if self.job is None:
+            return ""
+        return f"{self.job.pages_done}/{self.job.total_pages}"
+
+    @property
+    def message(self) -> str:
+        if self.error:
+            return self.error
+        if self.job is not None and self.state == State.FAILED:
+            lines = self.job.stderr.strip().splitlines()
+            status = f"exit status {self.job.returncode}"
+            return f"{status}: {lines[-1]}" if lines else status
+        return ""
+
+    def cancel(self):
+        self._cancelled = True
+        if self.job is not None:
+            self.job.cancel()
+        elif self.state == State.QUEUED:
+            self.state = State.CANCELLED
+
+    def update(self):
+        # Called from the scheduler's poll to pick up the job's outcome
+        if self.state != State.RUNNING or self.job is None or not self.job.done:
+            return
+        if self.job.cancelled:
+            self.state = State.CANCELLED
+        elif self.job.ok:
+            self.state = State.DONE
+        else:
+            self.state = State.FAILED
+
+
+# Runs queued conversions, at most max_workers at a time, in queue order.
+# Entries are only started from poll(), which the GUI calls on the Tk thread;
+# preparing a job (reading the page count, hashing for the result cache) is
+# done on a separate thread so the window stays responsive.
+class JobQueue:
+    def __init__(
+        self,
+        make_job: Callable[[QueueEntry], BaseJob],
+        *,
+        max_workers: int = 1,
+        on_started: Optional[Callable[[QueueEntry], None]] = None,
+    ):
+        self.entries: list[QueueEntry] = []
+        self.max_workers = max_workers
+        self._make_job = make_job
+        # Called on the starting thread once an entry has left STARTING, for
+        # callers that do not poll on a timer
+        self._on_started = on_started
+
+    @property
+    def active(self) -> list[QueueEntry]:
+        return [e for e in self.entries if e.state in (State.STARTING, State.RUNNING)]
+
+    @property
+    def busy(self) -> bool:
+        return any(not e.finished for e in self.entries)
+
+    def add(self, path: Path, profile: Profile) -> QueueEntry:
+        return self.put(QueueEntry(path, profile))
+
+    def put(self, entry: QueueEntry) -> QueueEntry:
+        self.entries.append(entry)
+        return entry
+
+    def move(self, entry: QueueEntry, offset: int):
+        index = self.entries.index(entry)
+        new_index = min(max(index + offset, 0), len(self.entries) - 1)
+        self.entries.insert(new_index, self.entries.pop(index))
+
+    def remove(self, entry: QueueEntry):
+        entry.cancel()
+        self.entries.remove(entry)
+
+    def clear_finished(self):
+        self.entries = [e for e in self.entries if not e.finished]
+
+    def cancel_all(self):
+        for entry in self.entries:
+            entry.cancel()
+
+    def poll(self):
+        for entry in self.entries:
+            entry.update()
+
+        free = self.max_workers - len(self.active)
+        for entry in self.entries:
+            if free <= 0:
+                break
+            if entry.state == State.QUEUED:
+                entry.state = State.STARTING
+                threading.Thread(target=self._start, args=(entry,), daemon=True).start()
+                free -= 1
+
+    def _start(self, entry: QueueEntry):
+        self._run_job(entry)
+        if self._on_started is not None:
+            self._on_started(entry)
+
+    def _run_job(self, entry: QueueEntry):
+        try:
+            job = self._make_job(entry)
+            if entry._cancelled:
+                entry.state = State.CANCELLED
+                return
+            entry.job = job
+            job.start()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Could not start conversion of %s: %s", entry.path, e)
+            entry.error = str(e)
+            entry.state = State.FAILED
+            return
+        entry.state = State.RUNNING
+        if entry._cancelled:
+            job.cancel()
+        # Jobs served from the result cache are already done at this point
+        entry.update()
@@ -0,0 +1,125 @@
+import tempfile
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+from ._cache import LRUCache, image_nbytes
+from ._config import Profile
+from ._convert import ConversionJob, k2pdfopt_args
+from ._render import DEFAULT_RENDERER, make_renderer
+from ._trace import span
+
+
+# Runs k2pdfopt on one source page at a time and keeps the rendered output
+# pages, keyed by the file and k2pdfopt's options (which include the page), so
+# returning to a page or to earlier slider positions needs no new run. Only one
+# run is in flight; starting another cancels it.
+class ReflowPreviewer:
+    def __init__(
+        self,
+        *,
+        executable: Optional[str] = None,
+        renderer: str = DEFAULT_RENDERER,
+        height: int = 600,
+        cache_bytes: Optional[int] = None,
+    ):
+        self.height = height
+        self._executable = executable
+        self._renderer = renderer
+        self._cache = LRUCache(
+            max_bytes=cache_bytes, sizeof=lambda pages: sum(map(image_nbytes, pages))
+        )
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="journal2ebook-reflow-")
+        self._job: Optional[ConversionJob] = None
+
+    def args(
+        self,
+        path: Path,
+        profile: Profile,
+        num_pages: int,
+        number: int,
+        *,
+        output: Optional[Path] = None,
+    ) -> list[str]:
+        return k2pdfopt_args(
+            path,
+            profile,
+            num_pages,
+            executable=self._executable,
+            pages=(number, number),
+            output=output or Path(self._tmpdir.name, "preview.pdf"),
+        )
+
+    def key(
+        self, path: Path, profile: Profile, num_pages: int, number: int
+    ) -> Hashable:
+        # Without the output and input paths, as in ResultCache.key
+        return (str(path), *self.args(path, profile, num_pages, number)[1:-3])
+
+    def cached(self, key: Hashable) -> Optional[list[Any]]:
+        return self._cache.get(key)
+
+    def cancel(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def start(
+        self, path: Path, profile: Profile, num_pages: int, number: int
+    ) -> Future:
+        # The future gets the output pages, is cancelled with the job, or fails
+        # with k2pdfopt's last error line
+        self.cancel()
+        output = Path(self._tmpdir.name) / f"{uuid.uuid4().hex}.pdf"
+        args = self.args(path, profile, num_pages, number, output=output)
+        key = (str(path), *args[1:-3])
+
+        future: Future = Future()
+        job = ConversionJob(args, pages=(number, number))
+        job.on_finished.append(lambda _job: self._finished(job, key, output, future))
+        try:
+            job.start()
+        except OSError as e:
+            future.set_exception(e)
+            return future
+        self._job = job
+        return future
+
+    def close(self):
+        self.cancel()
+        self._tmpdir.cleanup()
+
+    def _finished(
+        self, job: ConversionJob, key: Hashable, output: Path, future: Future
+    ):
+        # Runs on the job's thread
+        try:
+            if job.cancelled:
+                future.cancel()
+            elif not job.ok:
+                lines = job.stderr.strip().splitlines()
+                msg = f"k2pdfopt failed with exit status {job.returncode}"
+                future.set_exception(
+                    RuntimeError(f"{msg}: {lines[-1]}" if lines else msg)
+                )
+            else:
+                pages = self._render(output)
+                self._cache[key] = pages
+                future.set_result(pages)
+        except Exception as e:  # noqa: BLE001
+            future.set_exception(e)
+        finally:
+            output.unlink(missing_ok=True)
+
+    def _render(self, output: Path) -> list[Any]:
+        renderer = make_renderer(self._renderer, output)
+        try:
+            count = int(renderer.pdfinfo()["Pages"])
+            with span("reflow_render", pages=count):
+                return [
+                    renderer.render(number, dpi=72, size=(None, self.height))
+                    for number in range(1, count + 1)
+                ]
+        finally:
+            renderer.close()
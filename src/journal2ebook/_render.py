@@ -0,0 +1,342 @@
+import abc
+import io
+import logging
+import math
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDERER = "pdf2image"
+
+Size = Optional[tuple[Optional[int], Optional[int]]]
+# left, top, right, bottom in pixels of the page rendered at some height
+Box = tuple[int, int, int, int]
+
+# Neither pdfium nor MuPDF may be called from two threads at once, not even for
+# different documents; previews are rendered from several background threads.
+_PDFIUM_LOCK = threading.Lock()
+_MUPDF_LOCK = threading.Lock()
+
+
+def scale_for(
+    page_size: tuple[float, float], dpi: int, size: Size
+) -> tuple[float, Optional[tuple[int, int]]]:
+    # Same meaning of dpi and size as in pdf2image: a missing dimension keeps
+    # the aspect ratio, two dimensions give an exact size.
+    width, height = size or (None, None)
+    if width is None and height is None:
+        return dpi / 72, None
+    if width is None:
+        return height / page_size[1], None  # type: ignore[operator]
+    if height is None:
+        return width / page_size[0], None
+    return height / page_size[1], (width, height)
+
+
+def page_size_text(width: float, height: float) -> str:
+    # Formatted like pdfinfo, which Document parses
+    return f"{width:g} x {height:g} pts"
+
+
+def clip_box(box: Box, size: tuple[int, int]) -> Optional[Box]:
+    left, top, right, bottom = box
+    clipped = (max(left, 0), max(top, 0), min(right, size[0]), min(bottom, size[1]))
+    if clipped[0] >= clipped[2] or clipped[1] >= clipped[3]:
+        return None
+    return clipped
+
+
+def fit_region(img: Any, box: Box, clipped: Optional[Box], mode: str) -> Any:
+    # Gives a rendered region exactly the size of box: off-by-one sizes from
+    # rounding are resampled, and the part of box beyond the page is white
+    from PIL import Image
+
+    size = (box[2] - box[0], box[3] - box[1])
+    if clipped is None:
+        return Image.new(mode, size, "white")
+    inner = (clipped[2] - clipped[0], clipped[3] - clipped[1])
+    if img.size != inner:
+        img = img.resize(inner)
+    if inner == size:
+        return img
+    region = Image.new(mode, size, "white")
+    region.paste(img, (clipped[0] - box[0], clipped[1] - box[1]))
+    return region
+
+
+class Renderer(abc.ABC):
+    name = ""
+
+    def __init__(self, path: Path, *, grayscale: bool = False):
+        self.path = path
+        self.grayscale = grayscale
+
+    @property
+    def mode(self) -> str:
+        return "L" if self.grayscale else "RGB"
+
+    @abc.abstractmethod
+    def pdfinfo(self) -> dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def render(self, number: int, *, dpi: int, size: Size) -> Any: ...
+
+    @abc.abstractmethod
+    def render_region(self, number: int, *, height: int, box: Box) -> Any:
+        # Only box of the page scaled to height pixels, so that zoomed-in views
+        # never need a bitmap of the whole page
+        ...
+
+    def close(self):
+        pass
+
+
+class PopplerRenderer(Renderer):
+    # One pdftoppm (or pdftocairo) process per call, through pdf2image
+    name = "pdf2image"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        grayscale: bool = False,
+        low_memory: bool = False,
+        use_pdftocairo: bool = False,
+    ):
+        super().__init__(path, grayscale=grayscale)
+        self.use_pdftocairo = use_pdftocairo
+        if use_pdftocairo:
+            self.name = "pdftocairo"
+
+        # In low-memory mode pdftoppm writes grayscale pages to this directory
+        # as PGM files, which PIL memory-maps instead of reading. PIL cannot
+        # map RGB, and pdftocairo only writes PNG, so colour previews and
+        # pdftocairo would be copied onto the heap anyway and use the pipe.
+        self._spool = None
+        if low_memory and grayscale and not use_pdftocairo:
+            self._spool = tempfile.TemporaryDirectory(prefix="journal2ebook-")
+        elif low_memory:
+            logger.info(
+                "low_memory only applies to grayscale previews rendered by pdftoppm"
+            )
+
+    def pdfinfo(self) -> dict[str, Any]:
+        import pdf2image
+
+        return pdf2image.pdfinfo_from_path(self.path)
+
+    def render(self, number: int, *, dpi: int, size: Size) -> Any:
+        import pdf2image
+
+        kwargs: dict[str, Any] = {
+            "dpi": dpi,
+            "size": size,
+            "first_page": number,
+            "last_page": number,
+            "grayscale": self.grayscale,
+            "use_pdftocairo": self.use_pdftocairo,
+        }
+        if self._spool is None:
+            (img,) = pdf2image.convert_from_path(self.path, **kwargs)
+            return img
+
+        from PIL import Image
+
+        (path,) = pdf2image.convert_from_path(
+            self.path, output_folder=self._spool.name, paths_only=True, **kwargs
+        )
+        # The mapped pixels stay file-backed, so the kernel can drop them under
+        # memory pressure
+        img = Image.open(path)
+        img.load()
+        try:
+            Path(path).unlink()
+        except OSError:
+            # Windows does not allow removing a mapped file; the spool
+            # directory is removed with the document instead.
+            pass
+        return img
+
+    def render_region(self, number: int, *, height: int, box: Box) -> Any:
+        # pdf2image cannot crop, so poppler is run directly. Its output goes to
+        # stdout; pdftocairo needs "-" as the output file for that.
+        from PIL import Image
+
+        left, top, right, bottom = box
+        args = [
+            "pdftocairo" if self.use_pdftocairo else "pdftoppm",
+            *(["-png", "-singlefile"] if self.use_pdftocairo else []),
+            *["-f", str(number), "-l", str(number)],
+            *["-scale-to-x", "-1", "-scale-to-y", str(height)],
+            *["-x", str(left), "-y", str(top)],
+            *["-W", str(right - left), "-H", str(bottom - top)],
+            *(["-gray"] if self.grayscale else []),
+            str(self.path),
+            *(["-"] if self.use_pdftocairo else []),
+        ]
+        result = subprocess.run(args, capture_output=True, check=True)
+        img = Image.open(io.BytesIO(result.stdout)).convert(self.mode)
+        # poppler leaves out what lies beyond the page
+        clipped = (left, top, left + img.width, top + img.height)
+        return fit_region(img, box, clipped, self.mode)
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.cleanup()
+
+
+class PdfiumRenderer(Renderer):
+    # Keeps the document open in-process, so a render costs no process start,
+    # no re-parsing of the PDF and no pipe copy.
+    name = "pdfium"
+
+    def __init__(self, path: Path, *, grayscale: bool = False):
+        import pypdfium2
+
+        super().__init__(path, grayscale=grayscale)
+        with _PDFIUM_LOCK:
+            self._pdf = pypdfium2.PdfDocument(path)
+
+    def pdfinfo(self) -> dict[str, Any]:
+        with _PDFIUM_LOCK:
+            pages = len(self._pdf)
+            size = self._pdf.get_page_size(0) if pages else None
+        info: dict[str, Any] = {"Pages": pages}
+        if size is not None:
+            info["Page size"] = page_size_text(*size)
+        return info
+
+    def render(self, number: int, *, dpi: int, size: Size) -> Any:
+        with _PDFIUM_LOCK:
+            page = self._pdf[number - 1]
+            try:
+                scale, exact = scale_for(page.get_size(), dpi, size)
+                bitmap = page.render(
+                    scale=scale, grayscale=self.grayscale, rev_byteorder=True
+                )
+                # The PIL image shares the bitmap's buffer; convert() copies it
+                img = bitmap.to_pil().convert(self.mode)
+            finally:
+                page.close()
+        return img if exact is None else img.resize(exact)
+
+    def render_region(self, number: int, *, height: int, box: Box) -> Any:
+        with _PDFIUM_LOCK:
+            page = self._pdf[number - 1]
+            try:
+                page_width, page_height = page.get_size()
+                scale = height / page_height
+                # The page size in pixels as pypdfium2 computes it
+                size = (math.ceil(page_width * scale), math.ceil(page_height * scale))
+                clipped = clip_box(box, size)
+                img = None
+                if clipped is not None:
+                    # pdfium crops the pixels cut off each side, given in points
+                    # and rounded up again; the nudge keeps float error from
+                    # rounding up a whole number
+                    left, top, right, bottom = clipped
+                    crop = (left, size[1] - bottom, size[0] - right, top)
+                    bitmap = page.render(
+                        scale=scale,
+                        crop=tuple(max(c - 0.001, 0) / scale for c in crop),
+                        grayscale=self.grayscale,
+                        rev_byteorder=True,
+                    )
+                    img = bitmap.to_pil().convert(self.mode)
+            finally:
+                page.close()
+        return fit_region(img, box, clipped, self.mode)
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self._pdf.close()
+
+
+class MupdfRenderer(Renderer):
+    name = "mupdf"
+
+    def __init__(self, path: Path, *, grayscale: bool = False):
+        import pymupdf
+
+        super().__init__(path, grayscale=grayscale)
+        self._pymupdf = pymupdf
+        with _MUPDF_LOCK:
+            self._pdf = pymupdf.open(path)
+
+    def pdfinfo(self) -> dict[str, Any]:
+        with _MUPDF_LOCK:
+            pages = self._pdf.page_count
+            rect = self._pdf[0].rect if pages else None
+        info: dict[str, Any] = {"Pages": pages}
+        if rect is not None:
+            info["Page size"] = page_size_text(rect.width, rect.height)
+        return info
+
+    def render(self, number: int, *, dpi: int, size: Size) -> Any:
+        from PIL import Image
+
+        pymupdf = self._pymupdf
+        with _MUPDF_LOCK:
+            page = self._pdf[number - 1]
+            scale, exact = scale_for((page.rect.width, page.rect.height), dpi, size)
+            pixmap = page.get_pixmap(
+                matrix=pymupdf.Matrix(scale, scale),
+                colorspace=pymupdf.csGRAY if self.grayscale else pymupdf.csRGB,
+                alpha=False,
+            )
+        img = Image.frombytes(self.mode, (pixmap.width, pixmap.height), pixmap.samples)
+        return img if exact is None else img.resize(exact)
+
+    def render_region(self, number: int, *, height: int, box: Box) -> Any:
+        from PIL import Image
+
+        pymupdf = self._pymupdf
+        with _MUPDF_LOCK:
+            page = self._pdf[number - 1]
+            scale = height / page.rect.height
+            clipped = clip_box(box, (round(page.rect.width * scale), height))
+            if clipped is None:
+                return fit_region(None, box, None, self.mode)
+            pixmap = page.get_pixmap(
+                matrix=pymupdf.Matrix(scale, scale),
+                clip=pymupdf.Rect(*(c / scale for c in clipped)),
+                colorspace=pymupdf.csGRAY if self.grayscale else pymupdf.csRGB,
+                alpha=False,
+            )
+        img = Image.frombytes(self.mode, (pixmap.width, pixmap.height), pixmap.samples)
+        return fit_region(img, box, clipped, self.mode)
+
+    def close(self):
+        with _MUPDF_LOCK:
+            self._pdf.close()
+
+
+RENDERERS = ("pdf2image", "pdftocairo", "pdfium", "mupdf")
+
+
+def make_renderer(
+    name: str, path: Path, *, grayscale: bool = False, low_memory: bool = False
+) -> Renderer:
+    # The in-process renderers are optional; without them we fall back to
+    # pdf2image, which the package depends on anyway.
+    if name not in RENDERERS:
+        msg = f"Unknown renderer {name!r}; choose one of {', '.join(RENDERERS)}"
+        raise ValueError(msg)
+    if name in ("pdfium", "mupdf"):
+        cls = PdfiumRenderer if name == "pdfium" else MupdfRenderer
+        try:
+            return cls(path, grayscale=grayscale)
+        except ImportError as e:
+            logger.warning(
+                "Renderer %s is not available (%s), using pdf2image", name, e
+            )
+    return PopplerRenderer(
+        path,
+        grayscale=grayscale,
+        low_memory=low_memory,
+        use_pdftocairo=name == "pdftocairo",
+    )
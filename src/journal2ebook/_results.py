@@ -0,0 +1,96 @@
+import functools
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from ._diskcache import CHUNK_SIZE, DiskCache, file_digest, make_key
+
+STATS_FILE = "stats.json"
+
+
+# The mtime and size are only part of the cache key, so that a replaced binary
+# is hashed again
+@functools.lru_cache(maxsize=None)
+def _executable_digest(path: str, _mtime_ns: int, _size: int) -> str:
+    return file_digest(Path(path))
+
+
+def executable_fingerprint(executable: str) -> str:
+    # Hashing the binary pins the exact k2pdfopt build, which is stricter than
+    # its version banner and does not require running it.
+    resolved = shutil.which(executable)
+    if resolved is None:
+        return executable
+    stat = os.stat(resolved)
+    return _executable_digest(resolved, stat.st_mtime_ns, stat.st_size)
+
+
+# Finished k2pdfopt outputs, keyed by the input PDF's content and the argument
+# vector that produced them.
+class ResultCache:
+    def __init__(self, directory: Path, max_bytes: int):
+        self._cache = DiskCache(directory, max_bytes)
+        self._stats_path = directory / STATS_FILE
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self._stats_path, encoding="utf-8") as f:
+                stats = json.load(f)
+            self.hits, self.misses = stats["hits"], stats["misses"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def key(self, path: Path, args: list[str], *, digest: Optional[str] = None) -> str:
+        # args is [executable, *options, "-o", output, input]; where the result is
+        # written and what the input is called do not change its content.
+        options = args[1:-3]
+        return make_key(
+            digest or file_digest(path), executable_fingerprint(args[0]), *options
+        )
+
+    def lookup(self, key: str) -> Optional[Path]:
+        cached = self._cache.get(key, ".pdf")
+        self._count(hit=cached is not None)
+        return cached
+
+    def restore(self, cached: Path, output: Path):
+        # A copy rather than a hard link, which a later conversion to the same
+        # output would write through into the cache entry
+        fd, tmp = tempfile.mkstemp(dir=output.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(cached, tmp)
+            os.replace(tmp, output)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def store(self, key: str, output: Path):
+        if not output.exists():
+            return
+
+        def write(tmp: Path):
+            with open(output, "rb") as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+        self._cache.put(key, ".pdf", write)
+
+    def _count(self, *, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            self._stats_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._stats_path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({"hits": self.hits, "misses": self.misses}), "utf-8"
+            )
+            os.replace(tmp, self._stats_path)
@@ -0,0 +1,28 @@
+from typing import Any, Callable, Hashable, Optional
+
+
+# Collects invalidated parts of the preview and renders all of them in a single
+# pass once Tk is idle, so that bursts of slider events, page changes and
+# profile switches produce one frame update instead of one per event.
+class RenderScheduler:
+    def __init__(self, widget: Any, render: Callable[[set[Hashable]], None]):
+        self._widget = widget
+        self._render = render
+        self._dirty: set[Hashable] = set()
+        self._idle_id: Optional[str] = None
+
+    def invalidate(self, *parts: Hashable):
+        self._dirty.update(parts)
+        if self._idle_id is None:
+            self._idle_id = self._widget.after_idle(self._flush)
+
+    def cancel(self):
+        if self._idle_id is not None:
+            self._widget.after_cancel(self._idle_id)
+            self._idle_id = None
+        self._dirty.clear()
+
+    def _flush(self):
+        self._idle_id = None
+        dirty, self._dirty = self._dirty, set()
+        self._render(dirty)
@@ -0,0 +1,559 @@
+import contextlib
+import http.server
+import json
+import logging
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import parse_qs, quote, urlsplit
+
+import pdf2image
+
+from ._batch import ProfileChoice, record_job
+from ._convert import BaseJob, conversion_job, output_path
+from ._diskcache import CHUNK_SIZE, file_digest
+from ._exceptions import ProfileNotFoundError, QueueFullError
+from ._queue import JobQueue, QueueEntry, State
+from ._results import ResultCache
+from ._store import Store
+
+logger = logging.getLogger(__name__)
+
+# Latencies kept per route and per job stage for the percentiles in /metrics
+LATENCY_WINDOW = 1024
+
+# Longest a client may block on ?wait= before getting the current status
+MAX_WAIT = 300.0
+
+PDF_MAGIC = b"%PDF-"
+
+
+def summarize(values: Iterable[float]) -> dict[str, Any]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+
+    def at(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 6)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": at(0.5),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 6),
+    }
+
+
+class Metrics:
+    # Counters since startup; latencies only over the last LATENCY_WINDOW
+    # samples, so that the percentiles follow the current load.
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._requests: Counter[tuple[str, int]] = Counter()
+        self._latency: defaultdict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=LATENCY_WINDOW)
+        )
+        self._jobs: Counter[str] = Counter()
+        self._wait: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._run: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def request(self, route: str, status: int, seconds: float):
+        with self._lock:
+            self._requests[route, status] += 1
+            self._latency[route].append(seconds)
+
+    def transferred(self, *, received: int = 0, sent: int = 0):
+        with self._lock:
+            self.bytes_in += received
+            self.bytes_out += sent
+
+    def job(self, entry: "ServiceEntry"):
+        with self._lock:
+            self._jobs[entry.state.value] += 1
+            if entry.started_at is not None:
+                self._wait.append(entry.started_at - entry.queued_at)
+            if entry.job is not None:
+                self._run.append(entry.job.elapsed)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            uptime = time.monotonic() - self.started_at
+            finished = sum(self._jobs.values())
+            return {
+                "uptime_seconds": round(uptime, 1),
+                "requests": {
+                    f"{route} {status}": count
+                    for (route, status), count in sorted(self._requests.items())
+                },
+                "latency_seconds": {
+                    route: summarize(values)
+                    for route, values in sorted(self._latency.items())
+                },
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "jobs": dict(self._jobs),
+                "jobs_per_minute": round(finished / max(uptime, 1e-9) * 60, 3),
+                "queue_wait_seconds": summarize(self._wait),
+                "run_seconds": summarize(self._run),
+            }
+
+
+class ServiceEntry(QueueEntry):
+    def __init__(
+        self,
+        job_id: str,
+        path: Path,
+        profile: ProfileChoice,
+        name: str,
+        *,
+        filename: Optional[str] = None,
+    ):
+        # A callable profile is resolved when the job is prepared
+        super().__init__(path, profile)  # type: ignore[arg-type]
+        self.id = job_id
+        self.profile_name = name
+        self.output = output_path(path)
+        # The result under the name the client uploaded, which path only
+        # keeps in a reduced form
+        self.download_name = output_path(Path(filename or path.name)).name
+        self.submitted_at = time.time()
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.num_pages: Optional[int] = None
+        self.finished_event = threading.Event()
+
+    def to_json(self, position: Optional[int] = None) -> dict[str, Any]:
+        ret: dict[str, Any] = {
+            "id": self.id,
+            "state": self.state.value,
+            "file": self.path.name,
+            "profile": self.profile_name,
+            "submitted_at": self.submitted_at,
+            "pages": self.num_pages,
+        }
+        if position is not None:
+            ret["queue_position"] = position
+        if self.job is not None:
+            ret["pages_done"] = self.job.pages_done
+            ret["total_pages"] = self.job.total_pages
+            ret["run_seconds"] = round(self.job.elapsed, 3)
+        if self.message:
+            ret["message"] = self.message
+        if self.state == State.DONE:
+            ret["result"] = f"/jobs/{self.id}/result"
+        return ret
+
+
+# Runs uploaded PDFs through the same JobQueue as the GUI's queue window, with
+# the conversion prepared like App.convert does. The queue is advanced whenever
+# a job is added, started or finished, and expired jobs are also removed
+# between requests.
+class ConversionService:
+    def __init__(
+        self,
+        spool_dir: Path,
+        resolve: Callable[[str], ProfileChoice],
+        *,
+        store: Optional[Store] = None,
+        workers: int = 1,
+        max_queue: int = 100,
+        retention: float = 3600.0,
+        executable: Optional[str] = None,
+        shard_size: int = 0,
+        shard_workers: int = 1,
+        result_cache: Optional[ResultCache] = None,
+    ):
+        self.spool_dir = spool_dir
+        self.max_queue = max_queue
+        self.retention = retention
+        self.metrics = Metrics()
+        self._resolve = resolve
+        self._store = store
+        self._executable = executable
+        self._shard_size = shard_size
+        self._shard_workers = shard_workers
+        self._result_cache = result_cache
+
+        self._queue = JobQueue(
+            self._make_job, max_workers=workers, on_started=self._on_started
+        )
+        self._jobs: dict[str, ServiceEntry] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def workers(self) -> int:
+        return self._queue.max_workers
+
+    def _queued(self) -> list[QueueEntry]:
+        return [e for e in self._queue.entries if e.state == State.QUEUED]
+
+    def check_capacity(self):
+        with self._lock:
+            if len(self._queued()) >= self.max_queue:
+                msg = f"The queue is full ({self.max_queue} jobs waiting)"
+                raise QueueFullError(msg)
+
+    def submit(
+        self, read: Callable[[int], bytes], length: int, filename: str, profile: str
+    ) -> ServiceEntry:
+        # Raises ProfileNotFoundError, QueueFullError or ValueError for uploads
+        # that are not PDFs; the upload is spooled before it is queued.
+        choice = self._resolve(profile)
+        self.check_capacity()
+
+        job_id = uuid.uuid4().hex
+        directory = self.spool_dir / job_id
+        directory.mkdir(parents=True)
+        path = directory / upload_name(filename)
+        try:
+            _spool(read, length, path)
+            with self._lock:
+                self.check_capacity()
+                entry = ServiceEntry(
+                    job_id, path, choice, profile, filename=client_name(filename)
+                )
+                self._jobs[job_id] = entry
+                self._queue.put(entry)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        self.metrics.transferred(received=length)
+        logger.info("Queued %s (%s) as %s", filename, profile, job_id)
+        self._pump()
+        return entry
+
+    def get(self, job_id: str) -> Optional[ServiceEntry]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, entry: ServiceEntry) -> dict[str, Any]:
+        with self._lock:
+            queued = self._queued()
+            position = queued.index(entry) if entry in queued else None
+        return entry.to_json(position)
+
+    def cancel(self, entry: ServiceEntry):
+        entry.cancel()
+        self._pump()
+
+    def discard(self, entry: ServiceEntry):
+        with self._lock:
+            self._forget(entry)
+
+    def gauges(self) -> dict[str, Any]:
+        with self._lock:
+            states = Counter(e.state.value for e in self._queue.entries)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": states[State.QUEUED.value],
+            "running": states[State.STARTING.value] + states[State.RUNNING.value],
+            "retained": sum(states.values()),
+        }
+
+    def close(self):
+        with self._lock:
+            self._queue.cancel_all()
+            entries = list(self._queue.entries)
+        for entry in entries:
+            if entry.job is not None:
+                entry.job.wait(5)
+
+    def _make_job(self, entry: QueueEntry) -> BaseJob:
+        # Runs on a thread of the queue, like App._make_queue_job
+        assert isinstance(entry, ServiceEntry)
+        entry.started_at = time.monotonic()
+        if callable(entry.profile):
+            entry.profile = entry.profile(entry.path)
+            entry.profile_name = entry.profile.name
+
+        entry.num_pages = int(pdf2image.pdfinfo_from_path(str(entry.path))["Pages"])
+        digest = file_digest(entry.path)
+        job = conversion_job(
+            entry.path,
+            entry.profile,
+            entry.num_pages,
+            executable=self._executable,
+            output=entry.output,
+            shard_size=self._shard_size,
+            workers=self._shard_workers,
+            result_cache=self._result_cache,
+            digest=digest,
+        )
+        if self._store is not None:
+            store = self._store
+            job.on_finished.append(
+                lambda job: record_job(
+                    store,
+                    job,
+                    path=entry.path,
+                    profile=entry.profile,
+                    pages=entry.num_pages or 0,
+                    file_hash=digest,
+                    output=entry.output,
+                )
+            )
+        job.on_finished.append(lambda _job: self._pump())
+        return job
+
+    def _on_started(self, _entry: QueueEntry):
+        self._pump()
+
+    def expire(self):
+        # Called by the server between requests, so that an idle service also
+        # removes jobs that have outlived the retention time
+        self._pump()
+
+    def _pump(self):
+        with self._lock:
+            self._queue.poll()
+            now = time.monotonic()
+            for entry in list(self._jobs.values()):
+                if entry.finished and not entry.finished_event.is_set():
+                    entry.finished_at = now
+                    self.metrics.job(entry)
+                    entry.finished_event.set()
+                    logger.info("Job %s %s", entry.id, entry.state.value)
+                elif (
+                    entry.finished_at is not None
+                    and now - entry.finished_at > self.retention
+                ):
+                    self._forget(entry)
+
+    def _forget(self, entry: ServiceEntry):
+        entry.cancel()
+        self._jobs.pop(entry.id, None)
+        if entry in self._queue.entries:
+            self._queue.entries.remove(entry)
+        if entry.finished:
+            shutil.rmtree(entry.path.parent, ignore_errors=True)
+
+
+def client_name(filename: str) -> str:
+    # Without directories or control characters, and ending in .pdf
+    name = Path(filename.replace("\\", "/")).name
+    name = "".join(c for c in name if c.isprintable()) or "upload.pdf"
+    return name if name.lower().endswith(".pdf") else f"{name}.pdf"
+
+
+def upload_name(filename: str) -> str:
+    # Safe as a file name and inside a quoted header value: ASCII letters,
+    # digits and a few punctuation characters only
+    name = re.sub(r"[^A-Za-z0-9._ -]", "_", client_name(filename)).lstrip(". ")
+    return name if len(name) > len(".pdf") else "upload.pdf"
+
+
+def _spool(read: Callable[[int], bytes], length: int, path: Path):
+    remaining = length
+    with open(path, "wb") as f:
+        while remaining:
+            chunk = read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                msg = "Upload ended early"
+                raise ValueError(msg)
+            if remaining == length and not chunk.startswith(PDF_MAGIC):
+                msg = "Upload is not a PDF"
+                raise ValueError(msg)
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive connections, so every response needs a Content-Length
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, small responses
+    # wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+    server: "Server"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _dispatch(self, method: str):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        route, handler, args = self._route(method, parts)
+        status = 500
+        try:
+            status = handler(*args)
+        except Exception:
+            logger.exception("Error handling %s %s", method, self.path)
+            self.close_connection = True
+            status = self._send_json(500, {"error": "internal error"})
+        finally:
+            self.server.service.metrics.request(
+                route, status, time.perf_counter() - start
+            )
+
+    def _route(self, method: str, parts: list[str]) -> tuple[str, Callable, tuple]:
+        service = self.server.service
+        if parts == ["jobs"] and method == "POST":
+            return "POST /jobs", self._submit, ()
+        if parts in (["metrics"], ["health"]) and method == "GET":
+            handler = self._metrics if parts[0] == "metrics" else self._health
+            return f"GET /{parts[0]}", handler, ()
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            entry = service.get(parts[1])
+            if len(parts) == 2 and method in ("GET", "DELETE"):
+                job_handler = self._status if method == "GET" else self._delete
+                return f"{method} /jobs/ID", self._with_entry(job_handler, entry), ()
+            if parts[2:] == ["result"] and method == "GET":
+                return "GET /jobs/ID/result", self._with_entry(self._result, entry), ()
+        return "unmatched", self._not_found, ()
+
+    def _with_entry(
+        self, handler: Callable[[ServiceEntry], int], entry: Optional[ServiceEntry]
+    ) -> Callable[[], int]:
+        if entry is None:
+            return self._not_found
+        return lambda: handler(entry)
+
+    def _send_json(
+        self, status: int, body: Any, headers: Optional[dict[str, str]] = None
+    ) -> int:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        return status
+
+    def _not_found(self) -> int:
+        return self._send_json(404, {"error": "not found"})
+
+    def _health(self) -> int:
+        return self._send_json(200, {"ok": True})
+
+    def _metrics(self) -> int:
+        service = self.server.service
+        return self._send_json(200, {**service.metrics.snapshot(), **service.gauges()})
+
+    def _reject(self, status: int, message: str, **headers: str) -> int:
+        # The body may not have been read, so the connection cannot be reused
+        self.close_connection = True
+        return self._send_json(status, {"error": message}, headers)
+
+    def _submit(self) -> int:
+        service = self.server.service
+        content_length = self.headers.get("Content-Length")
+        if content_length is None or not content_length.isdigit():
+            return self._reject(411, "Content-Length is required")
+        length = int(content_length)
+        if length == 0:
+            return self._reject(400, "Empty upload")
+        if length > self.server.max_upload:
+            return self._reject(
+                413, f"Uploads are limited to {self.server.max_upload} bytes"
+            )
+
+        try:
+            entry = service.submit(
+                self.rfile.read,
+                length,
+                self.query.get("filename", "upload.pdf"),
+                self.query.get("profile", "Default"),
+            )
+        except ProfileNotFoundError as e:
+            return self._reject(404, str(e))
+        except QueueFullError as e:
+            return self._reject(503, str(e), **{"Retry-After": "5"})
+        except ValueError as e:
+            return self._reject(415, str(e))
+
+        return self._send_json(
+            202, service.status(entry), {"Location": f"/jobs/{entry.id}"}
+        )
+
+    def _wait(self, entry: ServiceEntry):
+        try:
+            timeout = min(float(self.query.get("wait", 0)), MAX_WAIT)
+        except ValueError:
+            timeout = 0
+        if timeout > 0:
+            entry.finished_event.wait(timeout)
+
+    def _status(self, entry: ServiceEntry) -> int:
+        self._wait(entry)
+        return self._send_json(200, self.server.service.status(entry))
+
+    def _delete(self, entry: ServiceEntry) -> int:
+        # Cancels an unfinished job; a finished one is discarded with its files
+        service = self.server.service
+        if entry.finished:
+            service.discard(entry)
+            return self._send_json(200, {"id": entry.id, "state": "discarded"})
+        service.cancel(entry)
+        return self._send_json(202, service.status(entry))
+
+    def _result(self, entry: ServiceEntry) -> int:
+        self._wait(entry)
+        if entry.state != State.DONE:
+            return self._send_json(409, self.server.service.status(entry))
+
+        with contextlib.ExitStack() as stack:
+            try:
+                f = stack.enter_context(open(entry.output, "rb"))
+            except OSError:
+                return self._send_json(410, {"error": "result no longer available"})
+            size = f.seek(0, 2)
+            f.seek(0)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(size))
+            # RFC 6266: an ASCII fallback and the original name, UTF-8 encoded
+            self.send_header(
+                "Content-Disposition",
+                f'attachment; filename="{entry.output.name}"; '
+                f"filename*=UTF-8''{quote(entry.download_name, safe='')}",
+            )
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+        self.server.service.metrics.transferred(sent=size)
+        return 200
+
+
+class Server(http.server.ThreadingHTTPServer):
+    # One thread per connection; the number of conversions running at once is
+    # bounded by the service's worker count, not by the connections.
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        service: ConversionService,
+        *,
+        max_upload: int = 200 * 1024**2,
+    ):
+        super().__init__(address, Handler)
+        self.service = service
+        self.max_upload = max_upload
+
+    def service_actions(self):
+        # Run by serve_forever() every poll interval, busy or not
+        self.service.expire()
@@ -0,0 +1,201 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    skip_first_page INTEGER NOT NULL DEFAULT 0,
+    many_cols INTEGER NOT NULL DEFAULT 0,
+    color INTEGER NOT NULL DEFAULT 0,
+    leftmargin REAL NOT NULL DEFAULT 0.0,
+    rightmargin REAL NOT NULL DEFAULT 1.0,
+    topmargin REAL NOT NULL DEFAULT 0.0,
+    bottommargin REAL NOT NULL DEFAULT 1.0,
+    fingerprints TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS profiles_position ON profiles (position);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,
+    path TEXT NOT NULL,
+    file_hash TEXT,
+    profile TEXT,
+    status TEXT NOT NULL,
+    returncode INTEGER,
+    seconds REAL,
+    pages INTEGER,
+    output TEXT,
+    output_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS history_finished_at ON history (finished_at);
+CREATE INDEX IF NOT EXISTS history_file_hash ON history (file_hash);
+CREATE INDEX IF NOT EXISTS history_profile ON history (profile, finished_at);
+"""
+
+PROFILE_COLUMNS = (
+    "name",
+    "skip_first_page",
+    "many_cols",
+    "color",
+    "leftmargin",
+    "rightmargin",
+    "topmargin",
+    "bottommargin",
+    "fingerprints",
+)
+
+HISTORY_COLUMNS = (
+    "finished_at",
+    "path",
+    "file_hash",
+    "profile",
+    "status",
+    "returncode",
+    "seconds",
+    "pages",
+    "output",
+    "output_bytes",
+)
+
+
+# Settings, profiles and conversion history in one SQLite database. Settings
+# values are JSON text; profiles are plain rows keyed by name and ordered by
+# position. The connection is shared between threads behind a lock.
+class Store:
+    def __init__(self, path: Path):
+        self.path = path
+        self.created = not path.exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._db.executescript(SCHEMA)
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def settings(self) -> dict[str, str]:
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM settings").fetchall()
+        return {row["key"]: row["value"] for row in rows}
+
+    def profiles(self) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(PROFILE_COLUMNS)} FROM profiles ORDER BY position"
+            ).fetchall()
+        return [_profile_from_row(row) for row in rows]
+
+    def profile(self, name: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(PROFILE_COLUMNS)} FROM profiles WHERE name = ?",
+                (name,),
+            ).fetchone()
+        return None if row is None else _profile_from_row(row)
+
+    def write(
+        self,
+        *,
+        settings: Iterable[tuple[str, str]] = (),
+        profiles: Iterable[tuple[int, dict[str, Any]]] = (),
+        deleted_profiles: Iterable[str] = (),
+    ):
+        # Applies one batch of changed rows in a single transaction
+        columns = ("position", *PROFILE_COLUMNS)
+        upsert_profile = (
+            f"INSERT INTO profiles ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (name) DO UPDATE SET "
+            + ", ".join(f"{c} = excluded.{c}" for c in columns if c != "name")
+        )
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "DELETE FROM profiles WHERE name = ?",
+                    [(name,) for name in deleted_profiles],
+                )
+                self._db.executemany(
+                    upsert_profile,
+                    [
+                        (position, *_profile_to_row(profile))
+                        for position, profile in profiles
+                    ],
+                )
+                self._db.executemany(
+                    "INSERT INTO settings (key, value) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    list(settings),
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def add_history(self, **values: Any):
+        values.setdefault("finished_at", time.time())
+        columns = [c for c in HISTORY_COLUMNS if c in values]
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO history ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [values[c] for c in columns],
+            )
+
+    def history(
+        self,
+        *,
+        profile: Optional[str] = None,
+        file_hash: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: Optional[int] = 50,
+    ) -> list[dict[str, Any]]:
+        conditions, params = [], []
+        for column, op, value in (
+            ("profile", "=", profile),
+            ("file_hash", "=", file_hash),
+            ("finished_at", ">=", since),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT * FROM history {where} ORDER BY finished_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+
+def _profile_to_row(profile: dict[str, Any]) -> tuple:
+    row = dict(profile)
+    row["fingerprints"] = json.dumps(row.get("fingerprints", []))
+    return tuple(row[c] for c in PROFILE_COLUMNS)
+
+
+def _profile_from_row(row: sqlite3.Row) -> dict[str, Any]:
+    profile = dict(row)
+    for flag in ("skip_first_page", "many_cols", "color"):
+        profile[flag] = bool(profile[flag])
+    profile["fingerprints"] = json.loads(profile["fingerprints"])
+    return profile
@@ -0,0 +1,24 @@
+from ._render import Box
+
+TILE_SIZE = 256
+
+# Zoom factors over the fit-to-window preview. Each level above 1 is a grid of
+# tiles rendered at that resolution; level 1 is the ordinary preview.
+ZOOM_LEVELS = (1.0, 1.5, 2.0, 3.0, 4.0)
+
+
+def next_zoom(zoom: float, step: int) -> float:
+    if step > 0:
+        return next((z for z in ZOOM_LEVELS if z > zoom), ZOOM_LEVELS[-1])
+    return next((z for z in reversed(ZOOM_LEVELS) if z < zoom), ZOOM_LEVELS[0])
+
+
+def visible_tiles(view: Box, size: tuple[int, int], tile: int = TILE_SIZE) -> list[Box]:
+    # Tiles stay on a fixed grid per level, so panning reuses rendered ones
+    left, top, right, bottom = view
+    width, height = size
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in range(max(top, 0) // tile * tile, min(bottom, height), tile)
+        for x in range(max(left, 0) // tile * tile, min(right, width), tile)
+    ]
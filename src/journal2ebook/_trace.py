@@ -0,0 +1,127 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Count and total seconds per stage, kept for the whole session
+STAGES: defaultdict[str, list[float]] = defaultdict(lambda: [0, 0.0])
+_stages_lock = threading.Lock()
+
+
+class Tracer:
+    # Collects spans as Chrome trace "complete" events, which chrome://tracing
+    # and Perfetto can open directly. A .jsonl path gets one event per line.
+    def __init__(self, path: Path):
+        self.path = path
+        self._origin = time.perf_counter()
+        self._events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, args: dict[str, Any]):
+        event = {
+            "name": name,
+            "cat": "journal2ebook",
+            "ph": "X",
+            "ts": round((start - self._origin) * 1e6, 1),
+            "dur": round(duration * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def write(self):
+        with self._lock:
+            events = list(self._events)
+        with open(self.path, "w", encoding="utf-8") as f:
+            if self.path.suffix == ".jsonl":
+                f.writelines(json.dumps(event, default=str) + "\n" for event in events)
+            else:
+                json.dump({"traceEvents": events}, f, default=str)
+        logger.info("Wrote %d trace events to %s", len(events), self.path)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start_trace(path: Path) -> Tracer:
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def stop_trace():
+    global _tracer
+    if _tracer is not None:
+        _tracer.write()
+        _tracer = None
+
+
+def record(name: str, duration: float, **args: Any):
+    with _stages_lock:
+        stage = STAGES[name]
+        stage[0] += 1
+        stage[1] += duration
+
+    logger.debug("%s took %.1f ms %s", name, duration * 1000, args or "")
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, time.perf_counter() - duration, duration, args)
+
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, **args)
+
+
+def log_stages():
+    with _stages_lock:
+        stages = sorted(STAGES.items(), key=lambda item: -item[1][1])
+    for name, (count, total) in stages:
+        logger.info(
+            "%-16s %6d calls %10.1f ms total %8.2f ms each",
+            name,
+            count,
+            total * 1000,
+            total * 1000 / count,
+        )
+
+
+@contextlib.contextmanager
+def profiled(limit: int = 30) -> Iterator[None]:
+    # cProfile only sees the main thread; background renders and conversions
+    # show up in the trace instead.
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(limit)
+
+        print(f"Peak traced Python memory: {peak / 1024**2:.1f} MB", file=sys.stderr)
+        for stat in snapshot.statistics("lineno")[:limit]:
+            print(stat, file=sys.stderr)
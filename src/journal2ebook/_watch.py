@@ -0,0 +1,293 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from ._batch import BatchResult
+from ._convert import OUTPUT_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = ".journal2ebook-watch.json"
+
+# Shortest wait between scans, so that --settle 0 does not spin
+MIN_WAIT = 0.1
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_candidate(path: Path) -> bool:
+    # Our own outputs land next to the inputs unless --output-dir is given
+    return (
+        path.suffix.lower() == ".pdf"
+        and not path.name.startswith(".")
+        and not path.stem.endswith(OUTPUT_SUFFIX)
+    )
+
+
+def file_signature(path: Path) -> Optional[tuple[int, float]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class Inotify:
+    # Minimal ctypes binding, so the watcher needs no third-party package
+    def __init__(self, directory: Path):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            msg = "libc not found"
+            raise OSError(msg)
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            msg = "inotify is not available"
+            raise OSError(msg)
+
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+        # Written to by wake() to interrupt a wait, e.g. on shutdown
+        self._wake_r, self._wake_w = os.pipe()
+
+    def wait(self, timeout: float) -> list[str]:
+        readable, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._wake_r in readable:
+            os.read(self._wake_r, 1024)
+        if self._fd not in readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def wake(self):
+        os.write(self._wake_w, b"\0")
+
+    def close(self):
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            os.close(fd)
+
+
+class WatchState:
+    # Which files were handled, keyed by name and remembered together with the
+    # size and mtime they had, so a replaced file is converted again.
+    def __init__(self, path: Path):
+        self.path = path
+        self.files: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable state file %s: %s", path, e)
+
+    def handled(self, path: Path, signature: tuple[int, float]) -> bool:
+        entry = self.files.get(path.name)
+        return entry is not None and (entry["size"], entry["mtime"]) == signature
+
+    def is_output(self, path: Path) -> bool:
+        return any(entry.get("output") == str(path) for entry in self.files.values())
+
+    def record(self, signature: tuple[int, float], result: BatchResult):
+        with self._lock:
+            self.files[result.path.name] = {
+                "size": signature[0],
+                "mtime": signature[1],
+                "status": result.status,
+                "seconds": round(result.seconds, 3),
+                "output": None if result.output is None else str(result.output),
+                "finished_at": time.time(),
+            }
+
+    def save(self, counters: dict[str, Any]):
+        with self._lock:
+            data = json.dumps({"files": self.files, "counters": counters}, indent=4)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+class Watcher:
+    def __init__(
+        self,
+        directory: Path,
+        convert: Callable[[Path], BatchResult],
+        *,
+        state: WatchState,
+        jobs: int = 1,
+        settle: float = 2.0,
+        poll_interval: float = 5.0,
+        report_interval: float = 60.0,
+        use_inotify: bool = True,
+        on_result: Optional[Callable[[BatchResult], None]] = None,
+    ):
+        self.directory = directory
+        self.state = state
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self._reported_at = time.monotonic()
+        self._convert = convert
+        self._on_result = on_result
+        self._executor = ThreadPoolExecutor(max_workers=max(jobs, 1))
+        self._stop = threading.Event()
+
+        # Files seen but not yet settled: name -> (signature, time it was seen)
+        self._settling: dict[str, tuple[tuple[int, float], float]] = {}
+        self._running: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.started_at = time.monotonic()
+        self.converted = 0
+        self.failed = 0
+
+        self._inotify: Optional[Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify(directory)
+            except (OSError, AttributeError) as e:
+                logger.info("inotify unavailable (%s), polling instead", e)
+
+    @property
+    def counters(self) -> dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._running)
+        minutes = max(time.monotonic() - self.started_at, 1e-9) / 60
+        return {
+            "settling": len(self._settling),
+            "queue_depth": in_flight,
+            "converted": self.converted,
+            "failed": self.failed,
+            "files_per_minute": round((self.converted + self.failed) / minutes, 3),
+            "uptime_seconds": round(minutes * 60, 1),
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._inotify is not None:
+            self._inotify.wake()
+
+    def run(self):
+        logger.info("Watching %s", self.directory)
+        # Files that arrived while we were not running
+        self._see(p.name for p in self.directory.iterdir())
+        try:
+            while not self._stop.is_set():
+                self._see(self._wait())
+                self._start_settled()
+                self._report()
+        finally:
+            inotify, self._inotify = self._inotify, None
+            if inotify is not None:
+                inotify.close()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self.state.save(self.counters)
+
+    def _report(self):
+        now = time.monotonic()
+        if now - self._reported_at >= self.report_interval:
+            self._reported_at = now
+            logger.info("%s", self.counters)
+
+    def _wait(self) -> Any:
+        # Settling files are rechecked sooner than the directory is rescanned
+        timeout = self.settle / 2 if self._settling else self.poll_interval
+        timeout = max(timeout, MIN_WAIT)
+        if self._inotify is None:
+            self._stop.wait(timeout)
+            return (p.name for p in self.directory.iterdir())
+        names = self._inotify.wait(timeout)
+        return names + list(self._settling)
+
+    def _see(self, names: Any):
+        now = time.monotonic()
+        for name in set(names):
+            path = self.directory / name
+            if name in self._running or not is_candidate(path):
+                continue
+            signature = file_signature(path)
+            if signature is None or self.state.handled(path, signature):
+                self._settling.pop(name, None)
+                continue
+            if self.state.is_output(path):
+                continue
+
+            previous = self._settling.get(name)
+            if previous is None or previous[0] != signature:
+                # New, or still being written: start the settle time over
+                self._settling[name] = (signature, now)
+
+    def _start_settled(self):
+        now = time.monotonic()
+        for name, (signature, seen) in list(self._settling.items()):
+            if now - seen < self.settle:
+                continue
+            del self._settling[name]
+            path = self.directory / name
+            logger.info("Converting %s", path)
+            future = self._executor.submit(self._convert, path)
+            with self._lock:
+                self._running[name] = future
+            future.add_done_callback(
+                lambda f, name=name, signature=signature: self._done(name, signature, f)
+            )
+
+    def _done(self, name: str, signature: tuple[int, float], future: Future):
+        with self._lock:
+            self._running.pop(name, None)
+        if future.cancelled():
+            return
+
+        result = future.result()
+        if result.status == "ok":
+            self.converted += 1
+        else:
+            self.failed += 1
+        self.state.record(signature, result)
+        try:
+            self.state.save(self.counters)
+        except OSError as e:
+            logger.error("Could not write state file %s: %s", self.state.path, e)
+        if self._on_result is not None:
+            self._on_result(result)
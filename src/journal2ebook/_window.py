@@ -1,21 +1,51 @@
+import copy
 import enum
-import subprocess
+import functools
+import logging
 import tkinter as tk
 import tkinter.filedialog
+import tkinter.messagebox
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
 from pathlib import Path
 from tkinter import ttk
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-import click
-import pdf2image
-from PIL import ImageTk
-
-from ._config import Config, Profile
+from ._cache import LRUCache, photo_nbytes
+from ._config import CACHE_DIR, Config, Profile
+from ._convert import BaseJob, conversion_job, output_path
+from ._diskcache import DiskCache, file_digest
+from ._document import DEFAULT_PAGE_SIZE, Document
 from ._exceptions import NoPdfSelectedError
+from ._memory import current_rss_bytes, peak_rss_bytes
+from ._prefetch import Prefetcher, run_in_background
+from ._queue import JobQueue, QueueEntry, State
+from ._reflow import ReflowPreviewer
+from ._results import ResultCache
+from ._scheduler import RenderScheduler
+from ._tiles import ZOOM_LEVELS, next_zoom, visible_tiles
+from ._trace import span
+
+logger = logging.getLogger(__name__)
 
 PADDING_BETWEEN_SLIDERS = 10
 SLIDERLENGTH = 14
 WINDOW_TITLE = "journal2ebook"
+PROGRESS_POLL_MS = 200
+
+# Parts of the window that RenderScheduler redraws next to the four Positions
+PAGE = "page"
+TILES = "tiles"
+OUTPUT = "output"
+
+# Pixels the zoomed page moves per mouse wheel step
+SCROLL_STEP = 60
+
+# Quiet time after the last change before k2pdfopt is run for the output preview
+OUTPUT_PREVIEW_DELAY_MS = 300
+
+# Height of the page thumbnails, and of a row in the strip with its page number
+THUMBNAIL_HEIGHT = 96
+THUMBNAIL_ROW = THUMBNAIL_HEIGHT + 24
 
 
 class Position(enum.Enum):
@@ -29,33 +59,23 @@ class Scale(tk.Scale):
     def __init__(self, master, *, position: Position):
         self.position = position
 
-        if self.position in (Position.LEFT, Position.RIGHT):
-            length = master.canvas.winfo_width()
+        if self.horizontal:
             orient: Any = tk.HORIZONTAL
         else:
-            length = master.canvas.winfo_height()
             orient = tk.VERTICAL
 
-        if self.position in (Position.LEFT, Position.TOP):
-            from_ = 0
-            to = 0.5 - 0.5 * (PADDING_BETWEEN_SLIDERS + SLIDERLENGTH) / length
-        else:
-            from_ = 0.5 + 0.5 * (PADDING_BETWEEN_SLIDERS + SLIDERLENGTH) / length
-            to = 1
-
         super().__init__(
             master,
-            from_=from_,
-            to=to,
             orient=orient,
             resolution=0.01,
             sliderlength=SLIDERLENGTH,
-            length=length / 2.0,
             showvalue=False,
-            command=lambda _: self.draw(),
+            command=lambda _: master.invalidate(position),
         )
+        self.resize()
 
-        self._item_id: Optional[int] = None
+        # One persistent line per slider, moved with coords() on every change
+        self._item_id = self.canvas.create_line(0, 0, 0, 0, fill="red", tags=("scale"))
 
         if self.position == Position.LEFT:
             self.grid(row=0, column=1, sticky=tk.W)
@@ -70,23 +90,466 @@ class Scale(tk.Scale):
             self.grid(row=2, column=0, sticky=tk.S)
             self.set(1.0)
 
+    @property
+    def horizontal(self) -> bool:
+        return self.position in (Position.LEFT, Position.RIGHT)
+
+    def resize(self):
+        # Sized from the preview rather than the canvas widget, which is not
+        # mapped yet while the window is being built
+        if self.horizontal:
+            length = self.master.width  # type: ignore[attr-defined]
+        else:
+            length = self.master.height  # type: ignore[attr-defined]
+
+        if self.position in (Position.LEFT, Position.TOP):
+            from_ = 0
+            to = 0.5 - 0.5 * (PADDING_BETWEEN_SLIDERS + SLIDERLENGTH) / length
+        else:
+            from_ = 0.5 + 0.5 * (PADDING_BETWEEN_SLIDERS + SLIDERLENGTH) / length
+            to = 1
+
+        self.configure(from_=from_, to=to, length=length / 2.0)
+
     @property
     def canvas(self):
         return self.master.canvas  # type: ignore[attr-defined]
 
     def draw(self):
-        if self.position in (Position.LEFT, Position.RIGHT):
-            x_pos = self.get() * self.canvas.winfo_width()
-            coords = (x_pos, 0, x_pos, self.canvas.winfo_height())
+        # Slider values are fractions of the page at any zoom; only the lines
+        # follow the zoomed and panned view
+        master: Any = self.master
+        width, height = master.width, master.height
+        if self.horizontal:
+            x_pos = self.get() * width * master.zoom - master.view_x
+            coords = (x_pos, 0, x_pos, height)
         else:
-            y_pos = self.get() * self.canvas.winfo_height()
-            coords = (0, y_pos, self.canvas.winfo_width(), y_pos)
+            y_pos = self.get() * height * master.zoom - master.view_y
+            coords = (0, y_pos, width, y_pos)
+
+        self.canvas.coords(self._item_id, *coords)
+
+
+class ConversionDialog(tk.Toplevel):
+    def __init__(self, master, job: BaseJob, *, title: str):
+        super().__init__(master, padx=10, pady=10)
+        self.job = job
+
+        self.wm_title(f"Converting {title}")
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
 
-        if self._item_id is None or self._item_id not in self.canvas.find_all():
-            self._item_id = self.canvas.create_line(*coords, fill="red", tags=("scale"))
+        self.status = tk.StringVar(self, value="Starting k2pdfopt...")
+        ttk.Label(self, text=title).grid(row=0, column=0, sticky=tk.W)
+
+        self.progress = ttk.Progressbar(
+            self, length=300, mode="determinate", maximum=job.total_pages
+        )
+        self.progress.grid(row=1, column=0, sticky=tk.E + tk.W, pady=5)
+
+        ttk.Label(self, textvariable=self.status).grid(row=2, column=0, sticky=tk.W)
+
+        button_cancel = ttk.Button(self, text="Cancel", command=self.cancel)
+        button_cancel.grid(row=3, column=0, sticky=tk.E)
+
+        self.after(PROGRESS_POLL_MS, self.poll)
+
+    def cancel(self):
+        self.job.cancel()
+
+    def poll(self):
+        job = self.job
+        if job.done:
+            self.destroy()
+            self.report()
+            return
+
+        self.progress.configure(value=job.pages_done)
+        status = f"Page {job.pages_done} of {job.total_pages}"
+        if job.eta is not None:
+            status += f", about {job.eta:.0f} s left"
+        self.status.set(status)
+
+        self.after(PROGRESS_POLL_MS, self.poll)
+
+    def report(self):
+        job = self.job
+        if job.cancelled:
+            tk.messagebox.showinfo(WINDOW_TITLE, "Conversion cancelled.")
+        elif job.ok:
+            tk.messagebox.showinfo(
+                WINDOW_TITLE, f"Conversion finished in {job.elapsed:.1f} s."
+            )
         else:
-            self.canvas.coords(self._item_id, *coords)
-            self.canvas.itemconfig(self._item_id, fill="red")
+            tk.messagebox.showerror(
+                WINDOW_TITLE,
+                f"k2pdfopt failed with exit status {job.returncode}.\n\n{job.stderr}",
+            )
+
+
+class OutputPane(ttk.Frame):
+    # Shows what k2pdfopt makes of the current source page; one source page
+    # usually becomes several output pages, which are paged through here.
+    def __init__(self, master, *, width: int, height: int):
+        super().__init__(master)
+        self.pages: list[Any] = []
+        self.index = 0
+        self.height = height
+
+        self.canvas = tk.Canvas(self, width=width, height=height)
+        self.canvas.grid(row=0, column=0, columnspan=3)
+        self._image_item = self.canvas.create_image(width / 2.0, height / 2.0)
+        self._text_item = self.canvas.create_text(
+            width / 2.0, height / 2.0, width=width - 20
+        )
+
+        self.status = tk.StringVar(self)
+        ttk.Button(self, text="<", width=2, command=lambda: self.turn(-1)).grid(
+            row=1, column=0, sticky=tk.W
+        )
+        ttk.Label(self, textvariable=self.status).grid(row=1, column=1)
+        ttk.Button(self, text=">", width=2, command=lambda: self.turn(1)).grid(
+            row=1, column=2, sticky=tk.E
+        )
+
+    def show_message(self, text: str):
+        self.pages = []
+        self.photo = None
+        self.canvas.itemconfigure(self._image_item, image="")
+        self.canvas.itemconfigure(self._text_item, text=text, state=tk.NORMAL)
+        self.status.set("")
+
+    def set_busy(self):
+        # The previous result stays visible until the new one arrives
+        if self.pages:
+            self.status.set(f"{self._page_label()}, updating...")
+        else:
+            self.show_message("Running k2pdfopt...")
+
+    def show_pages(self, pages: list[Any]):
+        self.pages = pages
+        self.index = min(self.index, len(pages) - 1)
+        self._draw()
+
+    def turn(self, offset: int):
+        if self.pages:
+            self.index = min(max(self.index + offset, 0), len(self.pages) - 1)
+            self._draw()
+
+    def _draw(self):
+        if not self.pages:
+            self.show_message("k2pdfopt produced no pages")
+            return
+
+        img = self.pages[self.index]
+        self.photo = photo_image(img)
+        self.canvas.configure(width=img.width)
+        self.canvas.coords(self._image_item, img.width / 2.0, self.height / 2.0)
+        self.canvas.coords(self._text_item, img.width / 2.0, self.height / 2.0)
+        self.canvas.itemconfigure(self._text_item, state=tk.HIDDEN)
+        self.canvas.itemconfigure(self._image_item, image=self.photo)
+        self.status.set(self._page_label())
+
+    def _page_label(self) -> str:
+        return f"Output page {self.index + 1} of {len(self.pages)}"
+
+
+# Lists every page of the document as a thumbnail. The canvas scrolls over all
+# pages, but only the rows in view, and a couple either side, have canvas items;
+# thumbnails are rendered for them on a background worker and at most
+# cache_pages are kept, so memory and redraws do not grow with the page count.
+class ThumbnailStrip(ttk.Frame):
+    OVERSCAN_ROWS = 2
+
+    def __init__(
+        self,
+        master,
+        *,
+        height: int,
+        on_select: Callable[[int], None],
+        cache_pages: int,
+    ):
+        super().__init__(master)
+        self.height = height
+        self.num_pages = 0
+        self.current = 1
+        self._on_select = on_select
+        self._width = int(
+            THUMBNAIL_HEIGHT * DEFAULT_PAGE_SIZE[0] / DEFAULT_PAGE_SIZE[1]
+        )
+
+        self.canvas = tk.Canvas(
+            self,
+            width=self._width + 12,
+            height=height,
+            yscrollincrement=THUMBNAIL_ROW,
+            yscrollcommand=self._on_scroll,
+        )
+        self.canvas.grid(row=0, column=0)
+        self.scrollbar = ttk.Scrollbar(
+            self, orient=tk.VERTICAL, command=self.canvas.yview
+        )
+        self.scrollbar.grid(row=0, column=1, sticky=tk.N + tk.S)
+        self._highlight = self.canvas.create_rectangle(
+            0, 0, 0, 0, outline="red", width=2, state=tk.HIDDEN
+        )
+
+        # Page number -> image item, label item and the PhotoImage shown
+        self._rows: dict[int, tuple[int, int, Any]] = {}
+        self._photos = LRUCache(max_items=cache_pages)
+        self._loader = Prefetcher(self, self._on_rendered, workers=1)
+        self._update_id: Optional[str] = None
+
+        self.canvas.bind("<Button-1>", self._on_click)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self._on_wheel)
+        self.bind("<Map>", lambda _: self._schedule_update())
+
+    def set_document(self, document: Optional[Document]):
+        for number in list(self._rows):
+            self._remove_row(number)
+        self._photos.clear()
+        if document is None:
+            self.num_pages = 0
+            self._loader.reset(None)
+        else:
+            self.num_pages = document.num_pages
+            self._width = int(THUMBNAIL_HEIGHT * document.aspect)
+            self._loader.reset(
+                functools.partial(document.render, size=(None, THUMBNAIL_HEIGHT))
+            )
+
+        self.canvas.configure(
+            width=self._width + 12,
+            scrollregion=(0, 0, self._width + 12, self.num_pages * THUMBNAIL_ROW),
+        )
+        self.canvas.yview_moveto(0)
+        self.set_current(self.current)
+        self._schedule_update()
+
+    def set_current(self, number: int):
+        self.current = number
+        if not 1 <= number <= self.num_pages:
+            self.canvas.itemconfigure(self._highlight, state=tk.HIDDEN)
+            return
+
+        top = (number - 1) * THUMBNAIL_ROW
+        self.canvas.coords(
+            self._highlight, 2, top + 1, self._width + 10, top + THUMBNAIL_ROW - 1
+        )
+        self.canvas.itemconfigure(self._highlight, state=tk.NORMAL)
+
+        # Scroll the current page into view if it is not
+        view_top = self.canvas.canvasy(0)
+        if top < view_top or top + THUMBNAIL_ROW > view_top + self.height:
+            total = self.num_pages * THUMBNAIL_ROW
+            self.canvas.yview_moveto(max(top - self.height / 2, 0) / total)
+
+    def running(self) -> list[Future]:
+        return self._loader.running()
+
+    def close(self):
+        if self._update_id is not None:
+            self.after_cancel(self._update_id)
+            self._update_id = None
+        self._loader.shutdown()
+
+    def _on_scroll(self, first: str, last: str):
+        self.scrollbar.set(first, last)
+        self._schedule_update()
+
+    def _schedule_update(self):
+        # Scrolling fires many events per frame; the rows follow once per idle
+        if self._update_id is None:
+            self._update_id = self.after_idle(self._update)
+
+    def _update(self):
+        self._update_id = None
+        if not self.winfo_ismapped() or not self.num_pages:
+            return
+
+        top = self.canvas.canvasy(0)
+        first = max(int(top // THUMBNAIL_ROW) - self.OVERSCAN_ROWS, 0)
+        last = min(
+            int((top + self.canvas.winfo_height()) // THUMBNAIL_ROW)
+            + self.OVERSCAN_ROWS,
+            self.num_pages - 1,
+        )
+        visible = range(first + 1, last + 2)
+
+        for number in list(self._rows):
+            if number not in visible:
+                self._remove_row(number)
+        for number in visible:
+            if number not in self._rows:
+                self._add_row(number)
+        self._loader.request(n for n in visible if n not in self._photos)
+
+    def _add_row(self, number: int):
+        x = self._width / 2.0 + 6
+        top = (number - 1) * THUMBNAIL_ROW
+        photo = self._photos.get(number)
+        image_item = self.canvas.create_image(
+            x, top + 4, anchor=tk.N, image="" if photo is None else photo
+        )
+        label_item = self.canvas.create_text(
+            x, top + THUMBNAIL_HEIGHT + 14, text=str(number)
+        )
+        self._rows[number] = (image_item, label_item, photo)
+
+    def _remove_row(self, number: int):
+        image_item, label_item, _ = self._rows.pop(number)
+        self.canvas.delete(image_item, label_item)
+
+    def _on_rendered(self, number: int, img: Any):
+        photo = photo_image(img)
+        self._photos[number] = photo
+        if number in self._rows:
+            image_item, label_item, _ = self._rows[number]
+            self.canvas.itemconfigure(image_item, image=photo)
+            self._rows[number] = (image_item, label_item, photo)
+
+    def _on_click(self, event):
+        number = int(self.canvas.canvasy(event.y) // THUMBNAIL_ROW) + 1
+        if 1 <= number <= self.num_pages:
+            self._on_select(number)
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or event.delta > 0
+        self.canvas.yview_scroll(-1 if up else 1, "units")
+
+
+class QueueWindow(tk.Toplevel):
+    COLUMNS = ("profile", "state", "progress", "elapsed", "message")
+
+    def __init__(self, master, queue: JobQueue, config: Config):
+        super().__init__(master, padx=10, pady=10)
+        self.queue = queue
+        self._config = config
+        self._entries: dict[str, QueueEntry] = {}
+
+        self.wm_title("Conversion queue")
+
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, height=12)
+        self.tree.heading("#0", text="File")
+        self.tree.column("#0", width=240)
+        for name in self.COLUMNS:
+            self.tree.heading(name, text=name.capitalize())
+            self.tree.column(name, width=80, stretch=name == "message")
+        self.tree.grid(row=0, column=0, columnspan=7, sticky=tk.NSEW)
+        self.columnconfigure(6, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        buttons = (
+            ("Add files...", master.enqueue_files),
+            ("Up", lambda: self.move(-1)),
+            ("Down", lambda: self.move(1)),
+            ("Cancel", self.cancel),
+            ("Remove", self.remove),
+            ("Clear finished", self.clear_finished),
+        )
+        for column, (text, command) in enumerate(buttons):
+            button = ttk.Button(self, text=text, command=command)
+            button.grid(row=1, column=column, sticky=tk.W, pady=5)
+
+        frame_options = ttk.Frame(self)
+        frame_options.grid(row=2, column=0, columnspan=7, sticky=tk.W)
+
+        self.profile_name = tk.StringVar(self)
+        profiles = ttk.Combobox(
+            frame_options,
+            textvariable=self.profile_name,
+            values=[p.name for p in config["profiles"]],
+            state="readonly",
+        )
+        profiles.grid(row=0, column=0)
+        button_profile = ttk.Button(
+            frame_options, text="Use for selected", command=self.assign_profile
+        )
+        button_profile.grid(row=0, column=1, padx=5)
+
+        ttk.Label(frame_options, text="Parallel jobs").grid(row=0, column=2, padx=5)
+        self.workers = tk.IntVar(self, value=queue.max_workers)
+        spinbox_workers = ttk.Spinbox(
+            frame_options,
+            from_=1,
+            to=64,
+            width=4,
+            textvariable=self.workers,
+            command=self.set_workers,
+        )
+        spinbox_workers.grid(row=0, column=3)
+        spinbox_workers.bind("<Return>", lambda _: self.set_workers())
+
+        self.refresh()
+
+    def selected(self) -> list[QueueEntry]:
+        return [self._entries[iid] for iid in self.tree.selection()]
+
+    def move(self, offset: int):
+        entries = self.selected()
+        # Move the selection as a block, starting from the end it moves towards
+        for entry in sorted(entries, key=self.queue.entries.index, reverse=offset > 0):
+            self.queue.move(entry, offset)
+        self.refresh()
+
+    def cancel(self):
+        for entry in self.selected():
+            entry.cancel()
+        self.refresh()
+
+    def remove(self):
+        for entry in self.selected():
+            self.queue.remove(entry)
+        self.refresh()
+
+    def clear_finished(self):
+        self.queue.clear_finished()
+        self.refresh()
+
+    def assign_profile(self):
+        name = self.profile_name.get()
+        profile = next((p for p in self._config["profiles"] if p.name == name), None)
+        if profile is None:
+            return
+        for entry in self.selected():
+            if entry.state == State.QUEUED:
+                entry.profile = copy.copy(profile)
+        self.refresh()
+
+    def set_workers(self):
+        try:
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            return
+        self.queue.max_workers = workers
+        self._config["queue_workers"] = workers
+        self.queue.poll()
+        self.refresh()
+
+    def refresh(self):
+        current = {}
+        for index, entry in enumerate(self.queue.entries):
+            iid = str(id(entry))
+            current[iid] = entry
+            elapsed = "" if entry.job is None else f"{entry.job.elapsed:.0f} s"
+            values = (
+                entry.profile.name,
+                entry.state.value,
+                entry.progress,
+                elapsed,
+                entry.message,
+            )
+            if iid in self._entries:
+                self.tree.item(iid, values=values)
+                self.tree.move(iid, "", index)
+            else:
+                self.tree.insert(
+                    "", index, iid=iid, text=entry.path.name, values=values
+                )
+
+        for iid in self._entries.keys() - current.keys():
+            self.tree.delete(iid)
+        self._entries = current
 
 
 class App(ttk.Frame):
@@ -102,10 +565,16 @@ class App(ttk.Frame):
 
     profiles: Any
 
-    _images: list[Any]
+    _document: Optional[Document]
+    _photos: LRUCache
+    _tiles: LRUCache
 
     width: int
     height: int
+    # Zoom factor and the offset of the view into the zoomed page, in pixels
+    zoom: float = 1.0
+    view_x: int = 0
+    view_y: int = 0
 
     def __init__(self, master, path: Path):
         super().__init__(master, padding=10)
@@ -116,13 +585,50 @@ class App(ttk.Frame):
         self.profile_name = tk.StringVar()
         self.is_editing_name = False  
 
+        self._prefetcher = Prefetcher(
+            self, self._on_page_rendered, workers=self._config["prefetch_workers"]
+        )
+        self._tile_loader = Prefetcher(
+            self, self._on_tile_rendered, workers=self._config["prefetch_workers"]
+        )
+        # Tiles on the canvas, with their PhotoImages so that eviction from
+        # _tiles cannot blank them
+        self._tile_items: dict[Any, tuple[int, Any]] = {}
+        self._pan_start: Optional[tuple[int, int, int, int]] = None
+        self.zoom_label = tk.StringVar(self, value="100%")
+        self.bind("<Destroy>", self._on_destroy)
+        self._scheduler = RenderScheduler(self, self.render)
+
+        self._result_cache = None
+        if self._config["result_cache_bytes"]:
+            self._result_cache = ResultCache(
+                CACHE_DIR / "outputs", self._config["result_cache_bytes"]
+            )
+
         self.path = self.require_path(path)
-        self.load_pdf()
+        self._document = None
 
         self.page = tk.IntVar(self, value=1)
-        self.page.trace_add("write", self.draw_image)
+        self.page.trace_add("write", lambda *_: self.invalidate(PAGE))
 
         self.grid()
+        self._queue = JobQueue(
+            self._make_queue_job, max_workers=self._config["queue_workers"]
+        )
+        self._queue_window: Optional[QueueWindow] = None
+        self._queue_poll_id: Optional[str] = None
+
+        self._reflow = ReflowPreviewer(
+            executable=self._config["k2pdfopt_path"],
+            renderer=self._config["renderer"],
+            cache_bytes=self._config["output_preview_cache_bytes"],
+        )
+        # Key of the output preview that should be shown, and the pending run
+        self._reflow_key: Any = None
+        self._reflow_after_id: Optional[str] = None
+        self.show_output = tk.BooleanVar(self, value=self._config["output_preview"])
+        self.show_thumbnails = tk.BooleanVar(self, value=self._config["thumbnails"])
+
         self.init_menu()
 
         self.set_width_height()
@@ -130,7 +636,18 @@ class App(ttk.Frame):
         self.canvas.grid(
             row=1, column=1, columnspan=2, rowspan=2, sticky=tk.NW, padx=7, pady=7
         )
-        self.draw_image()
+        # The page and the placeholder are created once and only reconfigured
+        # afterwards; the slider lines are created on top of them.
+        self._image_item = self.canvas.create_image(self.width / 2.0, self.height / 2.0)
+        self._placeholder_item = self.canvas.create_text(
+            self.width / 2.0, self.height / 2.0
+        )
+        self.canvas.bind("<ButtonPress-1>", self._start_pan)
+        self.canvas.bind("<B1-Motion>", self._pan)
+        self.canvas.bind("<ButtonRelease-1>", self._end_pan)
+        # X11 reports the wheel as buttons 4 and 5
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self._on_wheel)
 
         self.scale_left = Scale(self, position=Position.LEFT)
         self.scale_right = Scale(self, position=Position.RIGHT)
@@ -142,12 +659,33 @@ class App(ttk.Frame):
         self.skip_first_page = tk.BooleanVar(value=False)
         self.many_cols = tk.BooleanVar(value=False)
         self.color = tk.BooleanVar(value=False)
+        for option in (self.many_cols, self.color):
+            option.trace_add("write", lambda *_: self.invalidate(OUTPUT))
         self.init_extras()
 
+        self.thumbnails = ThumbnailStrip(
+            self,
+            height=self.height,
+            on_select=self.page.set,
+            cache_pages=self._config["thumbnail_cache_pages"],
+        )
+        self.thumbnails.grid(row=1, column=4, rowspan=2, sticky=tk.NW, pady=7)
+        if not self.show_thumbnails.get():
+            self.thumbnails.grid_remove()
+
+        self.output_pane = OutputPane(self, width=self.width, height=self.height)
+        self.output_pane.grid(row=1, column=5, rowspan=2, sticky=tk.NW, padx=7, pady=7)
+        if not self.show_output.get():
+            self.output_pane.grid_remove()
+
+        # The window is shown while the PDF is hashed and inspected
+        self.load_pdf()
 
     @property
     def num_pages(self) -> int:
-        return len(self._images)
+        if self._document is None:
+            return 1
+        return self._document.num_pages
 
     def require_path(self, path: Path | None) -> Path:
         if path is not None:
@@ -169,37 +707,334 @@ class App(ttk.Frame):
         return path
 
     def load_pdf(self):
-        self._images = pdf2image.convert_from_path(self.path)
+        # With a memory limit, a quarter of it goes to decoded previews and a
+        # quarter to the PhotoImages made from them.
+        limit = self._config["memory_limit_bytes"]
+        cache_bytes = self._config["page_cache_bytes"]
+        photo_bytes = None
+        if limit:
+            cache_bytes = min(cache_bytes, limit // 4)
+            photo_bytes = limit // 4
+
+        previous, self._document = self._document, None
+        self._fingerprint: Optional[str] = None
+        self.cancel_output_preview()
+        self._photos = LRUCache(
+            max_items=self._config["page_cache_pages"],
+            max_bytes=photo_bytes,
+            sizeof=photo_nbytes,
+        )
+        self._prefetcher.reset(None)
+        self._tiles = LRUCache(
+            max_bytes=self._config["tile_cache_bytes"], sizeof=photo_nbytes
+        )
+        self._tile_loader.reset(None)
+        self.clear_tiles()
+        self.zoom, self.view_x, self.view_y = 1.0, 0, 0
+        self.zoom_label.set("100%")
+        self.thumbnails.set_document(None)
+        if previous is not None:
+            self.close_document(previous)
+
+        self.canvas.itemconfigure(self._image_item, image="")
+        self.canvas.itemconfigure(
+            self._placeholder_item,
+            text=f"Loading {self.path.name}...",
+            state=tk.NORMAL,
+        )
+
+        load = functools.partial(
+            Document,
+            self.path,
+            cache_pages=self._config["page_cache_pages"],
+            cache_bytes=cache_bytes,
+            disk_cache=DiskCache(
+                CACHE_DIR / "previews", self._config["preview_cache_bytes"]
+            ),
+            grayscale=self._config["grayscale_previews"],
+            low_memory=self._config["low_memory"],
+            renderer=self._config["renderer"],
+        )
+        run_in_background(self, load, self._on_pdf_loaded)
+
+    def _on_pdf_loaded(self, future):
+        try:
+            document = future.result()
+        except Exception as e:  # noqa: BLE001
+            self.canvas.itemconfigure(
+                self._placeholder_item, text=f"Could not open PDF: {e}"
+            )
+            return
+        if document.path != self.path:
+            # Another PDF was opened in the meantime
+            document.close()
+            return
+
+        self._document = document
+        self.set_width_height()
+        self.canvas.configure(width=self.width, height=self.height)
+        self.canvas.coords(self._image_item, self.width / 2.0, self.height / 2.0)
+        self.canvas.coords(self._placeholder_item, self.width / 2.0, self.height / 2.0)
+        self._prefetcher.reset(
+            functools.partial(self._document.preview, height=self.height)
+        )
+        self._tile_loader.reset(lambda key: document.tile(*key))
+        self.thumbnails.set_document(document)
+
+        for scale in self.scales:
+            scale.resize()
+
+        self.invalidate(PAGE, *Position)
+        self.fingerprint_document()
+
+    def running_renders(self) -> list[Future]:
+        return [
+            *self._prefetcher.running(),
+            *self._tile_loader.running(),
+            *self.thumbnails.running(),
+        ]
+
+    def close_document(self, document: Document):
+        # Called once the loaders no longer render from the document; renders
+        # that were already running finish before its handles are released
+        running = self.running_renders()
+
+        def close():
+            wait(running)
+            document.close()
+
+        run_in_background(self, close, self._on_document_closed)
+
+    def _on_document_closed(self, future):
+        error = future.exception()
+        if error is not None:
+            logger.warning("Could not close the previous PDF: %s", error)
 
     def set_width_height(self, height=600):
-        img = self._images[self.page.get() - 1]
-        aspect = img.size[0] / img.size[1]
+        if self._document is None:
+            aspect = DEFAULT_PAGE_SIZE[0] / DEFAULT_PAGE_SIZE[1]
+        else:
+            aspect = self._document.aspect
 
         self.height = height
         self.width = int(height * aspect)
 
-    def draw_image(self, *args):
-        img = self._images[self.page.get() - 1]
-        img = img.resize((self.width, self.height))
+    def draw_image(self):
+        if self._document is None:
+            return
+
+        number = self.page.get()
+        self.prefetch(number)
+        if self.zoom > 1:
+            self.draw_zoomed(number)
+            return
+        self.clear_tiles()
+
+        photo = self._photos.get(number)
+        if photo is None:
+            img = self._document.cached_preview(number, self.height)
+            if img is None:
+                # Drawn from _on_page_rendered once the worker is done
+                return
+            photo = photo_image(img)
+            self._photos[number] = photo
+
+        self.img = photo
+        self.canvas.itemconfigure(self._placeholder_item, state=tk.HIDDEN)
+        self.canvas.itemconfigure(self._image_item, image=self.img)
+
+    def draw_zoomed(self, number: int):
+        if self.draw_tiles():
+            return
+
+        # Until its tiles are rendered, the view shows the preview enlarged
+        img = self._document.cached_preview(number, self.height)  # type: ignore[union-attr]
+        if img is None:
+            # Drawn from _on_page_rendered once the worker is done
+            return
+        zoom = self.zoom
+        box = (
+            self.view_x / zoom,
+            self.view_y / zoom,
+            (self.view_x + self.width) / zoom,
+            (self.view_y + self.height) / zoom,
+        )
+        self.img = photo_image(img.resize((self.width, self.height), box=box))
+        self.canvas.itemconfigure(self._placeholder_item, state=tk.HIDDEN)
+        self.canvas.itemconfigure(self._image_item, image=self.img)
+
+    def draw_tiles(self) -> bool:
+        # Places the rendered tiles of the visible part of the zoomed page and
+        # requests the missing ones; returns whether they cover the view
+        number = self.page.get()
+        width, height = self.zoomed_size
+        view = (
+            self.view_x,
+            self.view_y,
+            self.view_x + self.width,
+            self.view_y + self.height,
+        )
+        keys = [(number, height, box) for box in visible_tiles(view, (width, height))]
+        self._tile_loader.request(key for key in keys if key not in self._tiles)
+
+        items = {}
+        for key in keys:
+            photo = self._tiles.get(key)
+            if photo is None:
+                continue
+            x, y = key[2][0] - self.view_x, key[2][1] - self.view_y
+            if key in self._tile_items:
+                item, _ = self._tile_items.pop(key)
+                self.canvas.coords(item, x, y)
+            else:
+                item = self.canvas.create_image(x, y, anchor=tk.NW, image=photo)
+            items[key] = (item, photo)
+        for item, _ in self._tile_items.values():
+            self.canvas.delete(item)
+        self._tile_items = items
+        self.canvas.tag_raise("scale")
+        return len(items) == len(keys)
+
+    def clear_tiles(self):
+        for item, _ in self._tile_items.values():
+            self.canvas.delete(item)
+        self._tile_items = {}
+        self._tile_loader.cancel()
+
+    @property
+    def zoomed_size(self) -> tuple[int, int]:
+        return round(self.width * self.zoom), round(self.height * self.zoom)
+
+    def set_zoom(self, zoom: float, anchor: Optional[tuple[int, int]] = None):
+        # The point of the page under anchor (by default the middle of the
+        # view) stays where it is
+        zoom = min(max(zoom, ZOOM_LEVELS[0]), ZOOM_LEVELS[-1])
+        x, y = anchor or (self.width // 2, self.height // 2)
+        page_x = (self.view_x + x) / (self.width * self.zoom)
+        page_y = (self.view_y + y) / (self.height * self.zoom)
+
+        self.zoom = zoom
+        self.zoom_label.set(f"{zoom:.0%}")
+        self.pan_to(
+            page_x * self.width * zoom - x,
+            page_y * self.height * zoom - y,
+        )
 
-        self.img = ImageTk.PhotoImage(img)
-        self.canvas.create_image(self.width / 2.0, self.height / 2.0, image=self.img)
+    def pan_to(self, x: float, y: float):
+        width, height = self.zoomed_size
+        self.view_x = int(min(max(x, 0), width - self.width))
+        self.view_y = int(min(max(y, 0), height - self.height))
+        self.invalidate(PAGE, *Position)
+
+    def _start_pan(self, event):
+        self._pan_start = (event.x, event.y, self.view_x, self.view_y)
+
+    def _pan(self, event):
+        if self._pan_start is None or self.zoom == 1:
+            return
+        x, y, view_x, view_y = self._pan_start
+        self.pan_to(view_x - (event.x - x), view_y - (event.y - y))
 
-        for _id in self.canvas.find_withtag("scale"):
-            self.canvas.delete(_id)
-        self.canvas.update()
+    def _end_pan(self, _):
+        self._pan_start = None
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or event.delta > 0
+        if event.state & 0x4:  # Control
+            self.set_zoom(next_zoom(self.zoom, 1 if up else -1), (event.x, event.y))
+        elif self.zoom == 1:
+            return
+        elif event.state & 0x1:  # Shift
+            step = -SCROLL_STEP if up else SCROLL_STEP
+            self.pan_to(self.view_x + step, self.view_y)
+        else:
+            step = -SCROLL_STEP if up else SCROLL_STEP
+            self.pan_to(self.view_x, self.view_y + step)
+
+    @property
+    def scales(self) -> tuple[Scale, ...]:
+        return (self.scale_left, self.scale_right, self.scale_top, self.scale_bottom)
+
+    def invalidate(self, *parts: Any):
+        self._scheduler.invalidate(*parts)
+
+    def render(self, dirty: set):
+        with span("canvas_draw", page=PAGE in dirty):
+            if PAGE in dirty:
+                self.draw_image()
+                self.thumbnails.set_current(self.page.get())
+            elif TILES in dirty and self.zoom > 1:
+                self.draw_tiles()
+            for scale in self.scales:
+                if scale.position in dirty:
+                    scale.draw()
+        if self.show_output.get() and dirty & {PAGE, OUTPUT, *Position}:
+            self.update_output_preview()
+
+    def prefetch(self, number: int):
+        numbers = [number]
+        for offset in range(1, self._config["prefetch_pages"] + 1):
+            numbers.extend(
+                n
+                for n in (number + offset, number - offset)
+                if 1 <= n <= self.num_pages
+            )
+        self._prefetcher.request(n for n in numbers if n not in self._photos)
+
+    def _on_page_rendered(self, number: int, img: Any):
+        self._photos[number] = photo_image(img)
+        if number == self.page.get():
+            self.invalidate(PAGE)
+        self.enforce_memory_limit()
+
+    def _on_tile_rendered(self, key: Any, img: Any):
+        self._tiles[key] = photo_image(img)
+        if key[:2] == (self.page.get(), self.zoomed_size[1]):
+            self.invalidate(TILES)
+
+    def enforce_memory_limit(self):
+        limit = self._config["memory_limit_bytes"]
+        rss = current_rss_bytes()
+        if not limit or rss is None or rss <= limit or self._document is None:
+            return
+
+        # Keep only what is on screen; everything else can be rendered again
+        self._document.trim()
+        self._tiles.clear()
+        number = self.page.get()
+        current = self._photos.get(number)
+        self._photos.clear()
+        if current is not None:
+            self._photos[number] = current
+
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self._scheduler.cancel()
+            # k2pdfopt would otherwise keep running after the window is gone
+            self._queue.cancel_all()
+            self.cancel_output_preview()
+            self._reflow.close()
+            running = self.running_renders()
+            self._prefetcher.shutdown()
+            self._tile_loader.shutdown()
+            self.thumbnails.close()
+            if self._document is not None:
+                wait(running)
+                self._document.close()
+            self._config.flush()
+
+            peak = peak_rss_bytes()
+            if peak is not None:
+                logger.info("Peak resident memory: %.0f MB", peak / 1024**2)
 
     def open_pdf(self):
-        self.path = self.require_path(None)
+        path = self.require_path(None)
+        if path == self.path and self._document is not None:
+            return
+
+        self.path = path
         self.load_pdf()
-        self.set_width_height()
         self.page.set(1)
-        self.draw_image()
-
-        self.scale_left.draw()
-        self.scale_right.draw()
-        self.scale_top.draw()
-        self.scale_bottom.draw()
 
     def init_menu(self):
         menu = tk.Menu(self)
@@ -209,6 +1044,22 @@ class App(ttk.Frame):
         menu.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open PDF", command=self.open_pdf)
         file_menu.add_command(label="Convert PDF", command=self.convert)
+        file_menu.add_command(label="Detect margins", command=self.auto_margins)
+        file_menu.add_checkbutton(
+            label="Preview output",
+            variable=self.show_output,
+            command=self.toggle_output_preview,
+        )
+        file_menu.add_checkbutton(
+            label="Page thumbnails",
+            variable=self.show_thumbnails,
+            command=self.toggle_thumbnails,
+        )
+        file_menu.add_separator()
+        file_menu.add_command(label="Add to queue", command=self.enqueue_current)
+        file_menu.add_command(label="Add files to queue...", command=self.enqueue_files)
+        file_menu.add_command(label="Show queue", command=self.show_queue)
+        file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.master.destroy)
 
         about_menu = tk.Menu(menu)
@@ -235,6 +1086,29 @@ class App(ttk.Frame):
         entry_page.grid(row=0, column=1)
         entry_page.bind("<Return>", lambda _: self.update())
 
+        button_zoom_out = ttk.Button(
+            frame_page,
+            text="-",
+            width=2,
+            command=lambda: self.set_zoom(next_zoom(self.zoom, -1)),
+        )
+        button_zoom_out.grid(row=0, column=3, padx=(20, 0))
+        # Shows the zoom and goes back to the whole page
+        button_zoom_reset = ttk.Button(
+            frame_page,
+            textvariable=self.zoom_label,
+            width=5,
+            command=lambda: self.set_zoom(1.0),
+        )
+        button_zoom_reset.grid(row=0, column=4)
+        button_zoom_in = ttk.Button(
+            frame_page,
+            text="+",
+            width=2,
+            command=lambda: self.set_zoom(next_zoom(self.zoom, 1)),
+        )
+        button_zoom_in.grid(row=0, column=5)
+
     def init_extras(self):
         extras = ttk.Frame(self)
         extras.grid(row=1, column=3, rowspan=2, sticky=tk.N + tk.S)
@@ -272,9 +1146,22 @@ class App(ttk.Frame):
         button_convert.bind("<Button-1>", lambda _: self.convert())
         button_convert.bind("<Return>", lambda _: self.convert())
 
+        button_auto = ttk.Button(frame_buttons, text="Auto margins")
+        button_auto.grid(row=2, column=0, sticky=tk.E + tk.W)
+        button_auto.bind("<Button-1>", lambda _: self.auto_margins())
+        button_auto.bind("<Return>", lambda _: self.auto_margins())
+
+        check_output = ttk.Checkbutton(
+            frame_buttons,
+            text="Preview output",
+            variable=self.show_output,
+            command=self.toggle_output_preview,
+        )
+        check_output.grid(row=3, column=0, sticky=tk.W)
+
         button_quit = ttk.Button(frame_buttons)
         button_quit.configure(text="Quit")
-        button_quit.grid(row=2, column=0, sticky=tk.E + tk.W)
+        button_quit.grid(row=4, column=0, sticky=tk.E + tk.W)
         button_quit.bind("<Button-1>", lambda _: self.master.destroy())
         button_quit.bind("<Return>", lambda _: self.master.destroy())
 
@@ -314,8 +1201,20 @@ class App(ttk.Frame):
 
         self.apply_profile(self._config["last_profile"])
 
+    def name_taken(self, name: str) -> bool:
+        # Profiles are stored by name, so two of them cannot share one
+        return any(
+            profile.name == name
+            for index, profile in enumerate(self._config["profiles"])
+            if index != self.current_profile_index
+        )
+
     def add_new_profile(self):
-        new_profile = Profile(f"New Profile {len(self._config['profiles']) + 1}")
+        number = len(self._config["profiles"]) + 1
+        names = {profile.name for profile in self._config["profiles"]}
+        while f"New Profile {number}" in names:
+            number += 1
+        new_profile = Profile(f"New Profile {number}")
         self._config["profiles"].append(new_profile)
         self.profiles.insert(tk.END, new_profile.name)
         new_index = len(self._config["profiles"]) - 1
@@ -326,19 +1225,19 @@ class App(ttk.Frame):
         self._config["last_profile"] = new_index
         self.apply_profile(new_index)
         self._config.save()
-        print(f"Added new profile: {new_profile.name}, index: {new_index}")
+        logger.debug("Added profile %s at index %d", new_profile.name, new_index)
 
     def delete_profile(self):
         if self.current_profile_index is None:
-            print("No profile selected. Aborting delete.")
+            logger.debug("No profile selected, not deleting")
             return
 
         if len(self._config["profiles"]) <= 1:
-            print("Cannot delete the last remaining profile.")
+            logger.debug("Not deleting the last remaining profile")
             return
 
         deleted_profile = self._config["profiles"].pop(self.current_profile_index)
-        print(f"Deleted profile: {deleted_profile.name}")
+        logger.debug("Deleted profile %s", deleted_profile.name)
 
         # Update the listbox
         self.profiles.delete(self.current_profile_index)
@@ -358,7 +1257,6 @@ class App(ttk.Frame):
         # Update last_profile after deletion
         self._config["last_profile"] = self.current_profile_index
         self._config.save()
-        print(f"Profile deleted. Current index: {self.current_profile_index}")
 
     def on_entry_focus_in(self, event):
         self.is_editing_name = True
@@ -390,24 +1288,26 @@ class App(ttk.Frame):
         self.scale_right.set(profile.rightmargin)
         self.scale_top.set(profile.topmargin)
         self.scale_bottom.set(profile.bottommargin)
-
-        self.scale_left.draw()
-        self.scale_right.draw()
-        self.scale_top.draw()
-        self.scale_bottom.draw()
+        self.invalidate(*Position)
 
         if not self.is_editing_name:
             self.profile_name.set(profile.name)
 
-        print(f"Applied profile: {profile.name}")  # Debug output
-        print(f"Checkbox states: skip_first_page={profile.skip_first_page}, many_cols={profile.many_cols}, color={profile.color}")  # Debug output
+        logger.debug("Applied profile %s", profile)
 
         self._config.save()
 
 
     def save_profile(self):
         if self.current_profile_index is None:
-            print("No profile selected. Aborting save.")
+            logger.debug("No profile selected, not saving")
+            return
+
+        if self.name_taken(self.profile_name.get()):
+            tk.messagebox.showerror(
+                WINDOW_TITLE,
+                f"There already is a profile named {self.profile_name.get()!r}.",
+            )
             return
 
         profile = self._config["profiles"][self.current_profile_index]
@@ -422,10 +1322,13 @@ class App(ttk.Frame):
         profile.rightmargin = self.scale_right.get()
         profile.topmargin = self.scale_top.get()
         profile.bottommargin = self.scale_bottom.get()
+        if self._fingerprint is not None:
+            from ._fingerprint import remember
+
+            # So that documents laid out like this one select the profile
+            remember(profile, self._fingerprint)
 
-        print(f"Saving profile: {profile.name}")  # Debug output
-        print(f"Checkbox states: skip_first_page={profile.skip_first_page}, many_cols={profile.many_cols}, color={profile.color}")  # Debug output
-        print(f"Margins: left={profile.leftmargin}, right={profile.rightmargin}, top={profile.topmargin}, bottom={profile.bottommargin}")  # Debug output
+        logger.debug("Saving profile %r", profile)
 
         self._config.save()
         self.update_profiles_listbox()
@@ -434,19 +1337,24 @@ class App(ttk.Frame):
         self.profiles.selection_clear(0, tk.END)
         self.profiles.selection_set(self.current_profile_index)
         self.profiles.activate(self.current_profile_index)
-        
-        print(f"Profile saved successfully. Current index: {self.current_profile_index}")
+
 
 
 
     def rename_profile(self):
         new_name = self.profile_name.get()
         if not new_name:
-            print("New name is empty. Aborting rename.")
+            logger.debug("New name is empty, not renaming")
             return
 
         if self.current_profile_index is None:
-            print("No profile selected. Aborting rename.")
+            logger.debug("No profile selected, not renaming")
+            return
+
+        if self.name_taken(new_name):
+            tk.messagebox.showerror(
+                WINDOW_TITLE, f"There already is a profile named {new_name!r}."
+            )
             return
 
         old_name = self._config["profiles"][self.current_profile_index].name
@@ -455,7 +1363,7 @@ class App(ttk.Frame):
         self.profiles.insert(self.current_profile_index, new_name)
         self.profiles.selection_set(self.current_profile_index)
 
-        print(f"Renamed profile from '{old_name}' to '{new_name}'")  # Debug output
+        logger.debug("Renamed profile %s to %s", old_name, new_name)
         self._config.save()
         self.update_profiles_listbox()
 
@@ -471,56 +1379,294 @@ class App(ttk.Frame):
             self.profiles.selection_set(self.current_profile_index)
             self.profiles.activate(self.current_profile_index)
 
-        print(f"Updated profiles listbox. Current profiles: {[p.name for p in self._config['profiles']]}")
-        print(f"Current profile index: {self.current_profile_index}")
-
     def _increase_page(self, _):
         self.page.set(min(self.page.get() + 1, self.num_pages))
 
-        self.scale_left.draw()
-        self.scale_right.draw()
-        self.scale_top.draw()
-        self.scale_bottom.draw()
-
     def _decrease_page(self, _):
         self.page.set(max(1, self.page.get() - 1))
 
-        self.scale_left.draw()
-        self.scale_right.draw()
-        self.scale_top.draw()
-        self.scale_bottom.draw()
+    def current_profile(self) -> Profile:
+        return Profile(
+            name=self.profile_name.get(),
+            skip_first_page=self.skip_first_page.get(),
+            many_cols=self.many_cols.get(),
+            color=self.color.get(),
+            leftmargin=self.scale_left.get(),
+            rightmargin=self.scale_right.get(),
+            topmargin=self.scale_top.get(),
+            bottommargin=self.scale_bottom.get(),
+        )
+
+    def fingerprint_document(self):
+        document = self._document
+        if document is None:
+            return
+
+        def done(future):
+            if document is not self._document:
+                return
+            try:
+                self._fingerprint = future.result()
+            except Exception:
+                logger.exception("Could not fingerprint %s", document.path)
+                return
+            if self._config["auto_select_profile"]:
+                self.select_profile_by_layout()
+
+        from ._fingerprint import fingerprint_document
+
+        run_in_background(self, functools.partial(fingerprint_document, document), done)
+
+    def select_profile_by_layout(self):
+        from ._fingerprint import FingerprintIndex
+
+        if self._fingerprint is None:
+            return
+        profiles = self._config["profiles"]
+        profile = FingerprintIndex(profiles).nearest(self._fingerprint)
+        if profile is None:
+            return
+        index = profiles.index(profile)
+        if index == self.current_profile_index:
+            return
+
+        logger.info("Selected profile %s for %s", profile.name, self.path.name)
+        self.profiles.selection_clear(0, tk.END)
+        self.profiles.selection_set(index)
+        self.profiles.activate(index)
+        self.profiles.see(index)
+        self.apply_profile(index)
+
+    def auto_margins(self):
+        if self._document is None:
+            return
+
+        # numpy is only imported once margins are first detected
+        from ._margins import SAMPLE_SIZE, detect_margins, sample_pages
+
+        document = self._document
+        first = 2 if self.skip_first_page.get() and document.num_pages > 1 else 1
+        numbers = sample_pages(
+            first, document.num_pages, self._config["auto_margin_samples"]
+        )
+
+        def sample(number: int) -> Any:
+            # Previews already on hand are good enough; the rest are rendered
+            # at the size they are analysed at
+            img = document.cached_preview(number, self.height)
+            if img is None:
+                img = document.render(number, size=(None, SAMPLE_SIZE[1]))
+            return img
+
+        def detect() -> Any:
+            with ThreadPoolExecutor(self._config["prefetch_workers"]) as pool:
+                return detect_margins(list(pool.map(sample, numbers)))
+
+        run_in_background(self, detect, self._on_margins_detected)
+
+    def _on_margins_detected(self, future):
+        try:
+            margins = future.result()
+        except Exception as e:  # noqa: BLE001
+            tk.messagebox.showerror(WINDOW_TITLE, f"Could not detect margins: {e}")
+            return
+        if margins is None:
+            tk.messagebox.showinfo(WINDOW_TITLE, "No text found on the sampled pages")
+            return
+
+        for scale, value in zip(self.scales, margins):
+            scale.set(value)
+        self.invalidate(*Position)
+
+    def toggle_output_preview(self):
+        self._config["output_preview"] = self.show_output.get()
+        if self.show_output.get():
+            self.output_pane.grid()
+            self.invalidate(OUTPUT)
+        else:
+            self.output_pane.grid_remove()
+            self.cancel_output_preview()
+
+    def toggle_thumbnails(self):
+        self._config["thumbnails"] = self.show_thumbnails.get()
+        if self.show_thumbnails.get():
+            self.thumbnails.grid()
+        else:
+            self.thumbnails.grid_remove()
+
+    def cancel_output_preview(self):
+        if self._reflow_after_id is not None:
+            self.after_cancel(self._reflow_after_id)
+            self._reflow_after_id = None
+        self._reflow.cancel()
+        self._reflow_key = None
+
+    def update_output_preview(self):
+        if self._document is None:
+            return
+
+        request = (self.path, self.current_profile(), self.num_pages, self.page.get())
+        key = self._reflow.key(*request)
+        if key == self._reflow_key:
+            return
+        self.cancel_output_preview()
+        self._reflow_key = key
+
+        pages = self._reflow.cached(key)
+        if pages is not None:
+            self.output_pane.show_pages(pages)
+            return
+
+        # Sliders send many events per movement; k2pdfopt only runs once they
+        # have been still for a moment
+        self.output_pane.set_busy()
+        self._reflow_after_id = self.after(
+            OUTPUT_PREVIEW_DELAY_MS, functools.partial(self._start_reflow, request, key)
+        )
+
+    def _start_reflow(self, request: tuple, key: Any):
+        self._reflow_after_id = None
+        future = self._reflow.start(*request)
+        run_in_background(
+            self, future.result, functools.partial(self._on_reflowed, key)
+        )
+
+    def _on_reflowed(self, key: Any, future):
+        if key != self._reflow_key:
+            return
+        try:
+            pages = future.result()
+        except CancelledError:
+            return
+        except Exception as e:  # noqa: BLE001
+            self.output_pane.show_message(str(e))
+            return
+        self.output_pane.show_pages(pages)
 
     def convert(self):
-        args = [
-            "k2pdfopt",
-            "-x",
-            "-c" if self.color.get() else "-c-",
-            "-p",
-            f"{self.skip_first_page.get() + 1}-{self.num_pages}",
-            "-col",
-            f"{2 + 2 * int(self.many_cols.get())}",
-            "-ml",
-            f"{8.5 * self.scale_left.get():.3f}",
-            "-mr",
-            f"{8.5 * (1 - self.scale_right.get()):.3f}",
-            "-mt",
-            f"{11 * self.scale_top.get():.3f}",
-            "-mb",
-            f"{11 * (1 - self.scale_bottom.get()):.3f}",
-            "-ui-",
-            "-o",
-            f"{self.path.with_stem(self.path.stem + '_output')}",
-            str(self.path),
-        ]
+        if self._document is None:
+            return
+
+        job = conversion_job(
+            self.path,
+            self.current_profile(),
+            self.num_pages,
+            executable=self._config["k2pdfopt_path"],
+            shard_size=self._config["shard_size"],
+            workers=self._config["shard_workers"],
+            result_cache=self._result_cache,
+            digest=self._document.digest,
+        )
+        job.on_finished.append(
+            functools.partial(
+                self.record_history,
+                self.path,
+                self.current_profile(),
+                self._document.num_pages,
+                self._document.digest,
+            )
+        )
         try:
-            subprocess.run(args, check=True)
-        except subprocess.CalledProcessError:
-            pass
+            job.start()
+        except OSError as e:
+            tk.messagebox.showerror(WINDOW_TITLE, f"Could not run k2pdfopt: {e}")
+            return
+
+        ConversionDialog(self, job, title=self.path.name)
+
+    def enqueue_current(self):
+        self.enqueue([self.path])
+
+    def enqueue_files(self):
+        paths = tk.filedialog.askopenfilenames(
+            parent=self,
+            initialdir=self._config["last_dir"],
+            filetypes=[("pdf", "*.pdf")],
+        )
+        if paths:
+            self._config["last_dir"] = Path(paths[0]).parent.absolute()
+            self.enqueue([Path(p) for p in paths])
+
+    def enqueue(self, paths: list[Path]):
+        # Each file gets the margins and options currently shown; they can be
+        # changed per file in the queue window while it is still queued.
+        for path in paths:
+            self._queue.add(path, self.current_profile())
+        self.show_queue()
+        self._poll_queue()
+
+    def show_queue(self):
+        if self._queue_window is None or not self._queue_window.winfo_exists():
+            self._queue_window = QueueWindow(self, self._queue, self._config)
+        self._queue_window.lift()
+
+    def _poll_queue(self):
+        # Keeps draining the queue while the queue window is closed; the
+        # conversions run in their own processes and threads, so this is cheap.
+        if self._queue_poll_id is not None:
+            self.after_cancel(self._queue_poll_id)
+            self._queue_poll_id = None
+
+        self._queue.poll()
+        if self._queue_window is not None and self._queue_window.winfo_exists():
+            self._queue_window.refresh()
+        if self._queue.busy:
+            self._queue_poll_id = self.after(PROGRESS_POLL_MS, self._poll_queue)
+
+    def _make_queue_job(self, entry: QueueEntry) -> BaseJob:
+        # Runs on a worker thread of the queue
+        import pdf2image
+
+        num_pages = int(pdf2image.pdfinfo_from_path(entry.path)["Pages"])
+        digest = file_digest(entry.path)
+        job = conversion_job(
+            entry.path,
+            entry.profile,
+            num_pages,
+            executable=self._config["k2pdfopt_path"],
+            shard_size=self._config["shard_size"],
+            workers=self._config["shard_workers"],
+            result_cache=self._result_cache,
+            digest=digest,
+        )
+        job.on_finished.append(
+            functools.partial(
+                self.record_history, entry.path, entry.profile, num_pages, digest
+            )
+        )
+        return job
+
+    def record_history(
+        self,
+        path: Path,
+        profile: Profile,
+        num_pages: int,
+        digest: Optional[str],
+        job: BaseJob,
+    ):
+        # Called on the job's thread; the store serializes access itself
+        from ._batch import record_job
+
+        record_job(
+            self._config.store,
+            job,
+            path=path,
+            profile=profile,
+            pages=num_pages,
+            file_hash=digest,
+            output=output_path(path),
+        )
+
+
+def photo_image(img: Any) -> Any:
+    # PIL is only needed once the first page arrives, not to show the window
+    from PIL import ImageTk
+
+    with span("photo_image", width=img.width, height=img.height):
+        return ImageTk.PhotoImage(img)
 
 
-@click.command()
-@click.argument("path", type=click.Path(exists=True, path_type=Path), required=False)
-def main(path: Path):
+def run(path: Optional[Path]):
     root = tk.Tk()
     root.wm_title("journal2ebook")
     try:
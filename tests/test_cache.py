@@ -0,0 +1,36 @@
+from journal2ebook._cache import LRUCache
+
+
+def test_least_recently_used_item_is_evicted():
+    cache = LRUCache(max_items=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_byte_budget_counts_replaced_and_popped_items():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache["a"] = "xxxx"
+    cache["a"] = "xx"
+    cache["b"] = "xxxxxx"
+    assert cache.nbytes == 8
+    assert len(cache) == 2
+
+    assert cache.pop("a") == "xx"
+    assert cache.pop("a", "missing") == "missing"
+    assert cache.nbytes == 6
+
+
+def test_oversized_item_is_kept_alone():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache["a"] = "xxxx"
+    cache["b"] = "x" * 20
+
+    assert "a" not in cache
+    assert cache.get("b") == "x" * 20
+    assert cache.nbytes == 20
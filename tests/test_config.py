@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from journal2ebook import _config
+from journal2ebook._config import Config
+
+
+@pytest.fixture
+def config_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(_config, "CONFIG_PATH", tmp_path / "config.ini")
+    monkeypatch.setattr(_config, "DATABASE_PATH", tmp_path / "journal2ebook.db")
+    return tmp_path / "config.ini"
+
+
+def write_config_ini(path, names, last_profile):
+    profiles = [{"__dataclass__": True, "name": name} for name in names]
+    path.write_text(json.dumps({"profiles": profiles, "last_profile": last_profile}))
+
+
+def test_import_renames_duplicate_profiles(config_paths):
+    write_config_ini(config_paths, ["IEEE", "IEEE", "ACM", "IEEE"], 3)
+
+    config = Config()
+    names = ["IEEE", "IEEE (2)", "ACM", "IEEE (3)"]
+    assert [p.name for p in config["profiles"]] == names
+    assert config["last_profile"] == 3
+
+    # All of them were stored, in order
+    assert [p.name for p in Config()["profiles"]] == names
+
+
+@pytest.mark.parametrize("last_profile", [2, -1, "IEEE"])
+def test_out_of_range_last_profile_is_reset(config_paths, last_profile):
+    write_config_ini(config_paths, ["IEEE", "ACM"], last_profile)
+
+    assert Config()["last_profile"] == 0
+    assert Config()["last_profile"] == 0
+
+
+def test_config_ini_is_only_imported_into_a_new_database(config_paths):
+    write_config_ini(config_paths, ["IEEE"], 0)
+    text = config_paths.read_text()
+
+    config = Config()
+    config["shard_size"] = 25
+    config.flush()
+    assert config_paths.read_text() == text
+
+    write_config_ini(config_paths, ["ACM"], 0)
+    config = Config()
+    assert [p.name for p in config["profiles"]] == ["IEEE"]
+    assert config["shard_size"] == 25
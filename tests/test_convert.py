@@ -0,0 +1,130 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from journal2ebook._config import Profile
+from journal2ebook._convert import (
+    ConversionJob,
+    conversion_job,
+    k2pdfopt_args,
+    output_path,
+    shard_ranges,
+)
+
+
+def test_callbacks_run_once_when_waited_on():
+    job = ConversionJob([sys.executable, "-c", "pass"], pages=(1, 1))
+    successes, finishes = [], []
+    # A slow callback used to let wait() finish the job a second time
+    job.on_success.append(lambda: (time.sleep(0.1), successes.append(job.done)))
+    job.on_finished.append(finishes.append)
+
+    job.start()
+    waiters = [threading.Thread(target=job.wait) for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    assert job.wait(5) == 0
+    for waiter in waiters:
+        waiter.join(5)
+
+    assert successes == [True]
+    assert finishes == [job]
+    assert job.pages_done == 1
+
+
+def write_k2pdfopt(tmp_path, returncode):
+    # Copies the input to the -o output like k2pdfopt, then exits with returncode
+    script = tmp_path / "k2pdfopt"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import shutil, sys\n"
+        "shutil.copyfile(sys.argv[-1], sys.argv[sys.argv.index('-o') + 1])\n"
+        f"sys.exit({returncode})\n"
+    )
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.mark.parametrize("returncode", [0, 1])
+def test_output_is_replaced_only_after_success(tmp_path, returncode):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(b"new")
+    output = output_path(path)
+    output.write_bytes(b"old")
+
+    job = conversion_job(
+        path,
+        Profile("Test"),
+        1,
+        executable=write_k2pdfopt(tmp_path, returncode),
+    )
+    successes = []
+    job.on_success.append(lambda: successes.append(output.read_bytes()))
+    job.start()
+    assert job.wait(5) == returncode
+
+    assert output.read_bytes() == (b"new" if returncode == 0 else b"old")
+    assert successes == ([b"new"] if returncode == 0 else [])
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "k2pdfopt",
+        "paper.pdf",
+        "paper_output.pdf",
+    ]
+
+
+def test_k2pdfopt_args_convert_margins_to_inches():
+    profile = Profile(
+        "Test",
+        skip_first_page=True,
+        many_cols=True,
+        leftmargin=0.1,
+        rightmargin=0.9,
+        topmargin=0.05,
+        bottommargin=0.95,
+    )
+    args = k2pdfopt_args(Path("a.pdf"), profile, 12, executable="k2")
+    assert args == [
+        "k2",
+        "-x",
+        "-c-",
+        "-p",
+        "2-12",
+        "-col",
+        "4",
+        "-ml",
+        "0.850",
+        "-mr",
+        "0.850",
+        "-mt",
+        "0.550",
+        "-mb",
+        "0.550",
+        "-ui-",
+        "-o",
+        "a_output.pdf",
+        "a.pdf",
+    ]
+
+
+def test_k2pdfopt_args_for_a_page_range_and_output():
+    args = k2pdfopt_args(
+        Path("a.pdf"), Profile("Test"), 12, pages=(3, 5), output=Path("out.pdf")
+    )
+    assert args[:5] == ["k2pdfopt", "-x", "-c-", "-p", "3-5"]
+    assert args[-3:] == ["-o", "out.pdf", "a.pdf"]
+
+
+@pytest.mark.parametrize(
+    ("first", "last", "shard_size", "expected"),
+    [
+        (1, 10, 4, [(1, 4), (5, 8), (9, 10)]),
+        (2, 9, 4, [(2, 5), (6, 9)]),
+        (1, 3, 25, [(1, 3)]),
+        (5, 5, 1, [(5, 5)]),
+    ],
+)
+def test_shard_ranges_cover_the_page_range(first, last, shard_size, expected):
+    assert shard_ranges(first, last, shard_size) == expected
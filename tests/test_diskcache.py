@@ -0,0 +1,34 @@
+import os
+
+from journal2ebook._diskcache import DiskCache
+
+
+def put(cache, key, size):
+    return cache.put(key, ".bin", lambda path: path.write_bytes(b"x" * size))
+
+
+def test_overwriting_an_entry_replaces_its_size(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=100)
+    put(cache, "aa", 10)
+    for _ in range(20):
+        put(cache, "bb", 40)
+
+    assert cache._size == 50
+    assert cache.get("aa", ".bin") is not None
+    assert cache.get("bb", ".bin") is not None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=100)
+    for age, key in enumerate(["aa", "bb"]):
+        path = put(cache, key, 40)
+        os.utime(path, (age, age))
+    # A hit makes "aa" the most recently used entry
+    assert cache.get("aa", ".bin") is not None
+    put(cache, "cc", 40)
+
+    assert cache.get("bb", ".bin") is None
+    assert cache.get("aa", ".bin") is not None
+    assert cache.get("cc", ".bin") is not None
+    assert cache._size == 80
+    assert not list(tmp_path.glob("*/*.tmp"))
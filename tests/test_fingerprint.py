@@ -0,0 +1,58 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from journal2ebook._config import Profile
+from journal2ebook._fingerprint import (
+    MAX_FINGERPRINTS,
+    PAGE_BYTES,
+    PAGES,
+    FingerprintIndex,
+    fingerprint,
+    remember,
+)
+
+
+def layout(columns):
+    # A page with the given number of text columns
+    img = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(img)
+    width = 500 / columns
+    for i in range(columns):
+        left = 50 + i * width
+        draw.rectangle((left + 10, 100, left + width - 10, 700), 0)
+    draw.rectangle((50, 40, 550, 60), 0)
+    return img
+
+
+def test_nearest_profile_has_the_same_layout():
+    one = Profile("One column", fingerprints=[fingerprint([layout(1)])])
+    two = Profile("Two columns", fingerprints=[fingerprint([layout(2)])])
+    index = FingerprintIndex([one, two])
+
+    assert len(index) == 2
+    assert index.nearest(fingerprint([layout(2)] * 3)) is two
+    assert index.nearest(fingerprint([layout(1)])) is one
+    assert index.nearest(fingerprint([layout(2)]), max_distance=-1) is None
+
+
+def test_malformed_fingerprints_are_ignored():
+    profile = Profile("Broken", fingerprints=["00ff", fingerprint([layout(1)])])
+    index = FingerprintIndex([profile])
+
+    assert len(index) == 1
+    assert index.nearest("00ff") is None
+    assert FingerprintIndex([]).nearest(fingerprint([layout(1)])) is None
+
+
+def test_remember_skips_known_layouts_and_drops_the_oldest():
+    profile = Profile("Test")
+    assert remember(profile, fingerprint([layout(1)]))
+    assert not remember(profile, fingerprint([layout(1)]))
+
+    # Unrelated random layouts
+    values = [random.Random(n).randbytes(PAGES * PAGE_BYTES).hex() for n in range(10)]
+    for value in values:
+        remember(profile, value)
+    assert len(profile.fingerprints) == MAX_FINGERPRINTS
+    assert profile.fingerprints[-1] == values[-1]
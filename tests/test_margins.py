@@ -0,0 +1,45 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from journal2ebook._margins import PADDING, detect_margins, sample_pages
+
+
+def page(body, *, header=None):
+    # A white 600x800 page with black boxes given as fractions of its size
+    img = Image.new("RGB", (600, 800), "white")
+    draw = ImageDraw.Draw(img)
+    for box in (body, header):
+        if box is not None:
+            left, right, top, bottom = box
+            draw.rectangle((left * 600, top * 800, right * 600, bottom * 800), "black")
+    return img
+
+
+def test_body_box_is_found_with_padding():
+    margins = detect_margins([page((0.1, 0.9, 0.2, 0.8))] * 3)
+    assert margins == pytest.approx(
+        (0.1 - PADDING, 0.9 + PADDING, 0.2 - PADDING, 0.8 + PADDING), abs=0.01
+    )
+
+
+def test_running_header_is_left_out():
+    images = [page((0.1, 0.9, 0.2, 0.8), header=(0.4, 0.6, 0.05, 0.07))] * 3
+    _, _, top, _ = detect_margins(images)
+    assert top == pytest.approx(0.2 - PADDING, abs=0.01)
+
+
+def test_blank_pages_give_no_margins():
+    assert detect_margins([Image.new("RGB", (600, 800), "white")]) is None
+    assert detect_margins([]) is None
+
+
+@pytest.mark.parametrize(
+    ("first", "last", "count", "expected"),
+    [
+        (1, 4, 8, [1, 2, 3, 4]),
+        (1, 100, 3, [1, 50, 100]),
+        (2, 3, 1, [2]),
+    ],
+)
+def test_sample_pages_spread_over_the_document(first, last, count, expected):
+    assert sample_pages(first, last, count) == expected
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from journal2ebook._prefetch import Prefetcher
+
+
+class FakeWidget:
+    # Stands in for the Tk widget; callbacks run when the test calls run()
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, _ms, callback):
+        self.callbacks.append(callback)
+        return str(len(self.callbacks))
+
+    def after_cancel(self, _id):
+        pass
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def drain(widget, prefetcher):
+    # Waits for the submitted renders and polls until nothing is queued
+    for _ in range(10):
+        for future in list(prefetcher._pending.values()):
+            future.exception(timeout=5)
+        widget.run()
+        if not prefetcher._pending and not widget.callbacks:
+            return
+        # Done callbacks run just after waiters on the future are woken
+        time.sleep(0.01)
+
+
+def test_request_after_reset_while_rendering():
+    widget = FakeWidget()
+    ready = []
+    prefetcher = Prefetcher(widget, lambda n, result: ready.append((n, result)))
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_render(number):
+        started.set()
+        release.wait(5)
+        return f"old {number}"
+
+    prefetcher.reset(slow_render)
+    prefetcher.request([1])
+    assert started.wait(5)
+
+    # The old render cannot be cancelled any more; its result must be dropped
+    # without keeping page 1 pending
+    prefetcher.reset(lambda number: f"new {number}")
+    release.set()
+    drain(widget, prefetcher)
+    assert ready == []
+    assert not prefetcher._pending
+
+    prefetcher.request([1])
+    drain(widget, prefetcher)
+    assert ready == [(1, "new 1")]
+    prefetcher.shutdown()
+
+
+def test_request_renders_each_page_once():
+    widget = FakeWidget()
+    ready = []
+    prefetcher = Prefetcher(widget, lambda n, result: ready.append(n))
+    prefetcher.reset(lambda number: number)
+
+    prefetcher.request([1, 2, 3])
+    prefetcher.request([1, 2, 3])
+    drain(widget, prefetcher)
+    assert sorted(ready) == [1, 2, 3]
+    prefetcher.shutdown()
@@ -0,0 +1,37 @@
+from journal2ebook._results import ResultCache
+
+
+def make_args(output, path, *options):
+    return ["k2pdfopt", *options, "-ui-", "-o", str(output), str(path)]
+
+
+def test_key_ignores_output_and_input_names(tmp_path):
+    cache = ResultCache(tmp_path / "cache", 1024**2)
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.pdf"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+
+    key = cache.key(a, make_args(tmp_path / "a_out.pdf", a, "-col", "2"))
+    assert key == cache.key(b, make_args(tmp_path / "b_out.pdf", b, "-col", "2"))
+    assert key != cache.key(a, make_args(tmp_path / "a_out.pdf", a, "-col", "4"))
+
+
+def test_restored_output_does_not_share_the_cache_entry(tmp_path):
+    cache = ResultCache(tmp_path / "cache", 1024**2)
+    output = tmp_path / "out.pdf"
+    output.write_bytes(b"converted")
+    cache.store("key", output)
+
+    cached = cache.lookup("key")
+    assert cached is not None
+    output.write_bytes(b"stale")
+    cache.restore(cached, output)
+    assert output.read_bytes() == b"converted"
+
+    # A later conversion writing to the output leaves the entry alone
+    with open(output, "wb") as f:
+        f.write(b"other")
+    assert cached.read_bytes() == b"converted"
+    assert cache.hits == 1
+    assert cache.misses == 0
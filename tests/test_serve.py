@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from journal2ebook._config import Profile
+from journal2ebook._queue import State
+from journal2ebook._serve import (
+    ConversionService,
+    Server,
+    ServiceEntry,
+    client_name,
+    upload_name,
+)
+
+
+@pytest.mark.parametrize(
+    ("filename", "expected"),
+    [
+        ("paper.pdf", "paper.pdf"),
+        ("paper", "paper.pdf"),
+        ("a/b\\..\\x.pdf", "x.pdf"),
+        ('ré"sumé\r\nX-Evil: 1.pdf', "r__sum_X-Evil_ 1.pdf"),
+        ("файл.pdf", "____.pdf"),
+        ("..", "upload.pdf"),
+        ("\x00\x01", "upload.pdf"),
+    ],
+)
+def test_upload_name_is_safe_ascii(filename, expected):
+    assert upload_name(filename) == expected
+
+
+def test_client_name_keeps_unicode_without_control_characters():
+    assert client_name("dir/résumé\r\n.pdf") == "résumé.pdf"
+
+
+def test_idle_server_removes_expired_jobs(tmp_path):
+    service = ConversionService(tmp_path, lambda name: Profile(name), retention=0.0)
+    path = tmp_path / "job" / "paper.pdf"
+    path.parent.mkdir()
+    path.write_bytes(b"%PDF")
+    entry = ServiceEntry("job", path, Profile("Default"), "Default")
+    entry.state = State.DONE
+    service._jobs[entry.id] = entry
+
+    server = Server(("127.0.0.1", 0), service)
+    try:
+        server.service_actions()
+        assert entry.finished_event.is_set()
+        time.sleep(0.01)
+        server.service_actions()
+    finally:
+        server.server_close()
+
+    assert service.get("job") is None
+    assert not path.parent.exists()
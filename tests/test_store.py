@@ -0,0 +1,45 @@
+from dataclasses import asdict
+
+from journal2ebook._config import Profile
+from journal2ebook._store import Store
+
+
+def row(name, **values):
+    return asdict(Profile(name, **values))
+
+
+def test_profiles_keep_their_order_and_types(tmp_path):
+    store = Store(tmp_path / "test.db")
+    assert store.created
+    store.write(
+        profiles=[
+            (1, row("B", color=True, fingerprints=["ab"])),
+            (0, row("A")),
+        ],
+        settings=[("last_profile", "1")],
+    )
+    store.write(deleted_profiles=["A"], profiles=[(2, row("C"))])
+    store.close()
+
+    store = Store(tmp_path / "test.db")
+    assert not store.created
+    assert [p["name"] for p in store.profiles()] == ["B", "C"]
+    profile = store.profile("B")
+    assert profile is not None
+    assert profile["color"] is True
+    assert profile["many_cols"] is False
+    assert profile["fingerprints"] == ["ab"]
+    assert store.profile("A") is None
+    assert store.settings() == {"last_profile": "1"}
+
+
+def test_history_is_filtered_and_newest_first(tmp_path):
+    store = Store(tmp_path / "test.db")
+    for finished_at, profile in [(1.0, "A"), (2.0, "B"), (3.0, "A")]:
+        store.add_history(
+            finished_at=finished_at, path="x.pdf", profile=profile, status="ok"
+        )
+
+    assert [row["finished_at"] for row in store.history(profile="A")] == [3.0, 1.0]
+    assert [row["profile"] for row in store.history(since=2.0)] == ["A", "B"]
+    assert len(store.history(limit=1)) == 1
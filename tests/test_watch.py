@@ -0,0 +1,40 @@
+import pytest
+
+from journal2ebook._watch import MIN_WAIT, Watcher, WatchState
+
+
+class RecordingEvent:
+    def __init__(self):
+        self.timeouts = []
+
+    def wait(self, timeout):
+        self.timeouts.append(timeout)
+        return False
+
+
+@pytest.mark.parametrize(
+    ("settle", "settling", "expected"),
+    [
+        (2.0, False, 5.0),
+        (2.0, True, 1.0),
+        (0.0, False, 5.0),
+        (0.0, True, MIN_WAIT),
+    ],
+)
+def test_polling_waits_for_poll_interval_unless_files_settle(
+    tmp_path, settle, settling, expected
+):
+    watcher = Watcher(
+        tmp_path,
+        lambda path: None,
+        state=WatchState(tmp_path / "state.json"),
+        settle=settle,
+        poll_interval=5.0,
+        use_inotify=False,
+    )
+    watcher._stop = RecordingEvent()
+    if settling:
+        watcher._settling["a.pdf"] = ((1, 0.0), 0.0)
+
+    list(watcher._wait())
+    assert watcher._stop.timeouts == [expected]